@@ -1,13 +1,29 @@
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException
+from enum import Enum
+from fastapi import FastAPI, Depends, HTTPException, Request, Header
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from fastapi.security.http import HTTPAuthorizationCredentials, HTTPBearer
 from cassandra import ConsistencyLevel
-from cassandra.cluster import Cluster, Session, ResultSet
-from cassandra.auth import PlainTextAuthProvider
+from cassandra.cluster import Session
 from cassandra.query import SimpleStatement
-import uvicorn, dotenv, os, jwt, typing
-from data_objects.database_objects import Database, Signal, Source, Timeseries
+from starlette.background import BackgroundTask
+from pydantic import ValidationError
+import asyncio, logging, uvicorn, dotenv, os, jwt, typing
+from data_objects.database_objects import Database, Signal, SignalRef, SignalWrite, MultiSignalRead, BulkWriteEntryResult, WriteResult, Source, Timeseries, InvalidNameError, DatatypeMismatchError, as_utc, clean_name, datatype_name
+from data_objects.session_manager import SessionManager, SessionLease
+from data_objects.token_cache import TokenCache
+from data_objects.ingest_buffer import IngestBuffer
+from data_objects.bulk_write import MEDIA_TYPE_MSGPACK, UnsupportedMediaTypeError, MalformedBodyError, decode_signal_writes
+from data_objects.async_bridge import execute_async
+from data_objects.aggregation import AggregationMode, Alignment, UnsupportedDatatypeError
+from data_objects.metadata_catalog import etag_matches
+from data_objects.metrics import SessionCollector, RequestMetricsMiddleware, metrics_response, prepare_multiprocess_dir, register_process_collector, unregister_process_collector, stage
+from data_objects.columnar import MEDIA_TYPE_COLUMNAR_JSON, UnsupportedEncodingError, negotiate_media_type, encode, encode_ndjson_rows, encode_columnar_block, encode_multi_json, encode_aligned_json
 
+log = logging.getLogger()
 
 #Env var loading
 dotenv.load_dotenv()
@@ -15,11 +31,93 @@ cluster_addrs = os.environ.get("CASSANDRA_URLS").split(",")
 JWT_SECRET = os.environ.get("JWT_SECRET")
 CASSANDRA_PORT = int(os.environ.get("CASSANDRA_PORT"))
 CASSANDRA_KEYSPACE = os.environ.get("CASSANDRA_KEYSPACE")
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", "32"))
+SESSION_IDLE_TIMEOUT_SEK = float(os.environ.get("SESSION_IDLE_TIMEOUT_SEK", "600"))
+WRITE_CONCURRENCY = int(os.environ.get("WRITE_CONCURRENCY", "32"))
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "100"))
+READ_CONCURRENCY = int(os.environ.get("READ_CONCURRENCY", "16"))
+STREAM_FETCH_SIZE = int(os.environ.get("STREAM_FETCH_SIZE", "5000"))
+LATEST_DP_CACHE_TTL_SEK = float(os.environ.get("LATEST_DP_CACHE_TTL_SEK", "1"))
+METADATA_REFRESH_SEK = float(os.environ.get("METADATA_REFRESH_SEK", "30"))
+ACCESS_TOKEN_EXPIRE_MINUTES = float(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+MAX_ALIGNED_POINTS = int(os.environ.get("MAX_ALIGNED_POINTS", "100000"))
+MAX_MULTI_SIGNALS = int(os.environ.get("MAX_MULTI_SIGNALS", "100"))
+ROLLUPS_ENABLED = os.environ.get("ROLLUPS_ENABLED", "false").lower() in ("1", "true", "yes")
+ROLLUP_DELAY_SEK = float(os.environ.get("ROLLUP_DELAY_SEK", "1"))
+HOT_WINDOW_SEK = float(os.environ.get("HOT_WINDOW_SEK", "3600"))
+HOT_WINDOW_TTL_SEK = float(os.environ.get("HOT_WINDOW_TTL_SEK", "2"))
+HOT_WINDOW_MAX_POINTS = int(os.environ.get("HOT_WINDOW_MAX_POINTS", "500000"))
+HOT_WINDOW_RELOAD_SEK = float(os.environ.get("HOT_WINDOW_RELOAD_SEK", "300"))
+INGEST_BUFFER_ENABLED = os.environ.get("INGEST_BUFFER_ENABLED", "false").lower() in ("1", "true", "yes")
+INGEST_BUFFER_MAX_POINTS = int(os.environ.get("INGEST_BUFFER_MAX_POINTS", "100000"))
+INGEST_BUFFER_FLUSH_POINTS = int(os.environ.get("INGEST_BUFFER_FLUSH_POINTS", "1000"))
+INGEST_BUFFER_FLUSH_INTERVAL_SEK = float(os.environ.get("INGEST_BUFFER_FLUSH_INTERVAL_SEK", "1"))
+TYPED_TABLES = os.environ.get("TYPED_TABLES", "true").lower() in ("1", "true", "yes")
+WIDE_VALUES = os.environ.get("WIDE_VALUES", "false").lower() in ("1", "true", "yes")
+DATA_TTL_SEK = int(os.environ.get("DATA_TTL_SEK", "0"))
+COMPACTION_WINDOW_DAYS = int(os.environ.get("COMPACTION_WINDOW_DAYS", "1"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+API_WORKERS = int(os.environ.get("API_WORKERS", "1"))
+SHUTDOWN_TIMEOUT_SEK = int(os.environ.get("SHUTDOWN_TIMEOUT_SEK", "25"))
 
-app = FastAPI()
+session_manager = SessionManager(contact_points=cluster_addrs, port=CASSANDRA_PORT, max_entries=SESSION_CACHE_MAX_ENTRIES, idle_timeout_sek=SESSION_IDLE_TIMEOUT_SEK)
+session_collector = SessionCollector(session_manager)
+token_cache = TokenCache(max_age_sek=ACCESS_TOKEN_EXPIRE_MINUTES * 60, max_entries=TOKEN_CACHE_MAX_ENTRIES)
+
+database = Database(keyspace_name=CASSANDRA_KEYSPACE, write_concurrency=WRITE_CONCURRENCY, write_batch_size=WRITE_BATCH_SIZE, read_concurrency=READ_CONCURRENCY, latest_dp_ttl_sek=LATEST_DP_CACHE_TTL_SEK, metadata_refresh_sek=METADATA_REFRESH_SEK, rollups_enabled=ROLLUPS_ENABLED, hot_window_sek=HOT_WINDOW_SEK, hot_window_ttl_sek=HOT_WINDOW_TTL_SEK, hot_window_max_points=HOT_WINDOW_MAX_POINTS, hot_window_reload_sek=HOT_WINDOW_RELOAD_SEK, typed_tables=TYPED_TABLES, wide_values=WIDE_VALUES, data_ttl_sek=DATA_TTL_SEK, compaction_window_days=COMPACTION_WINDOW_DAYS, rollup_delay_sek=ROLLUP_DELAY_SEK, session_manager=session_manager)
+ingest_buffer = IngestBuffer(database, session_manager=session_manager, max_points=INGEST_BUFFER_MAX_POINTS, flush_points=INGEST_BUFFER_FLUSH_POINTS, flush_interval_sek=INGEST_BUFFER_FLUSH_INTERVAL_SEK) if INGEST_BUFFER_ENABLED else None
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    register_process_collector(session_collector)
+    if(API_WORKERS > 1):
+        await warm_up_worker()
+    if(ingest_buffer is not None):
+        ingest_buffer.start()
+    yield
+    # Buffered points and their rollups are written before the sessions they belong to are closed
+    if(ingest_buffer is not None):
+        await ingest_buffer.drain()
+    await database.drain_rollups()
+    unregister_process_collector(session_collector)
+    session_manager.shutdown()
+
+"""
+Connects the session of the configured credentials and loads the known tables in a freshly
+started worker, so its first requests do not pay for it. The structure was already created
+by main(), a worker that can not connect yet still starts and connects on its first request.
+"""
+async def warm_up_worker():
+    if("CASSANDRA_USERNAME" not in os.environ) or ("CASSANDRA_PASSWORD" not in os.environ):
+        return
+    try:
+        session = await run_in_threadpool(session_manager.get_session, os.environ.get("CASSANDRA_USERNAME"), os.environ.get("CASSANDRA_PASSWORD"))
+        await run_in_threadpool(database.load_tables, session)
+    except Exception:
+        log.exception("Worker could not connect at startup, it connects on the first request instead.")
+
+app = FastAPI(lifespan=lifespan)
 app.title = "DB-Timeseries-Platform-API"
+app.add_middleware(RequestMetricsMiddleware, profile_sample_rate=PROFILE_SAMPLE_RATE, profile_dir=PROFILE_DIR)
 security = HTTPBearer
-database = Database(keyspace_name=CASSANDRA_KEYSPACE)
+
+@app.exception_handler(InvalidNameError)
+@app.exception_handler(UnsupportedDatatypeError)
+@app.exception_handler(MalformedBodyError)
+@app.exception_handler(DatatypeMismatchError)
+async def invalid_request_handler(request:Request, exc:ValueError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(UnsupportedEncodingError)
+async def unsupported_encoding_handler(request:Request, exc:UnsupportedEncodingError):
+    return JSONResponse(status_code=406, content={"detail": str(exc)})
+
+@app.exception_handler(UnsupportedMediaTypeError)
+async def unsupported_media_type_handler(request:Request, exc:UnsupportedMediaTypeError):
+    return JSONResponse(status_code=415, content={"detail": str(exc)})
+
 """
 Returns the JWT subtoken
 """
@@ -42,108 +140,352 @@ async def get_token_from_requests(auth: typing.Optional[HTTPAuthorizationCredent
         token = auth.credentials
         return token
 """
-This function returns a new DB session with the supplied 
-credentials
+This function returns the pooled DB session for the supplied 
+credentials, connecting a new one on first use
  """
 def get_db_session_atomic(username, password) -> Session:
-    cluster = Cluster(contact_points=cluster_addrs, port = CASSANDRA_PORT)
-    auth_provider = PlainTextAuthProvider(username=username, password=password)
-    cluster.auth_provider = auth_provider
     try:
-        return cluster.connect()
+        return session_manager.get_session(username, password)
     except:
         raise HTTPException(status_code=401, detail="Session could not be created with current token!")
 
+"""
+Async variant of get_db_session_atomic, only a cache miss connects
+in a worker thread so the event loop is never blocked on it
+"""
+async def get_db_session(username, password) -> Session:
+    session = session_manager.get_cached_session(username, password)
+    if session is not None:
+        return session
+    return await run_in_threadpool(get_db_session_atomic, username, password)
+
+"""
+Borrows the pooled DB session for the supplied credentials, connecting
+a new one on first use. The lease has to be released by the caller.
+"""
+def lease_db_session_atomic(username, password) -> SessionLease:
+    try:
+        return session_manager.lease(username, password)
+    except:
+        raise HTTPException(status_code=401, detail="Session could not be created with current token!")
+
+"""
+Borrows the DB session of the bearer token. Verified tokens are cached with the key of
+their credentials, so only the first request of a token decodes it. A borrowed session is
+not evicted by the session manager before the lease is released.
+"""
+async def get_lease_from_requests(token: str = Depends(get_token_from_requests)) -> SessionLease:
+    credential_key = token_cache.get(token)
+    if credential_key is not None:
+        lease = session_manager.lease_cached_by_key(credential_key)
+        if lease is not None:
+            return lease
+    try:
+        authdict = get_up_from_jwt_token(token)
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token!")
+    lease = await run_in_threadpool(lease_db_session_atomic, authdict['username'], authdict['password'])
+    token_cache.put(token, lease.credential_key, exp=authdict.get("exp"))
+    return lease
+
+"""
+Returns the DB session of the bearer token, it is borrowed until the request is answered
+"""
+async def get_session_from_requests(lease: SessionLease = Depends(get_lease_from_requests)) -> typing.AsyncIterator[Session]:
+    try:
+        yield lease.session
+    finally:
+        lease.release()
+
 @app.get("/")
-def get_root():
+async def get_root():
     return "Hello to IoT API"
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    content, media_type = metrics_response()
+    return Response(content=content, media_type=media_type)
+
 @app.get("/getToken", include_in_schema=False)
 @app.get("/getToken/")
-def get_root(username: str, password: str):
+async def get_root(username: str, password: str):
     if (username==None or password == None):
         raise HTTPException(status_code=400, detail="No username/password provided!")
     else:
         try:
-            session = get_db_session_atomic(username,password)
+            await get_db_session(username,password)
         except:
             raise HTTPException(status_code=401, detail="Invalid username/password!")
-        return get_jwt_token_up(username, password)
+        token = get_jwt_token_up(username, password)
+        token_cache.put(token, session_manager.credential_key(username, password))
+        return token
 
 @app.get("/keyspaces", include_in_schema=False)
 @app.get("/keyspaces/")
-def get_keyspaces(token: str = Depends(get_token_from_requests)):
-    authdict = get_up_from_jwt_token(token)
-    session:Session = get_db_session_atomic(authdict['username'], authdict['password'])
+async def get_keyspaces(session: Session = Depends(get_session_from_requests)):
     query = SimpleStatement("""
         DESCRIBE KEYSPACES;
         """, consistency_level=ConsistencyLevel.ONE)
     
-    query_result:ResultSet = session.execute(query)
-    all_keyspaces = list(query_result)
+    all_keyspaces = await execute_async(session, query)
     return all_keyspaces
 
 @app.post("/addSignal", include_in_schema=False)
 @app.post("/addSignal/")
-def add_signal(signal:Signal, token: str = Depends(get_token_from_requests)):
-    authdict = get_up_from_jwt_token(token)
-    session:Session = get_db_session_atomic(authdict['username'], authdict['password'])
-    database.add_signal(signal=signal, session=session)
+async def add_signal(signal:Signal, session: Session = Depends(get_session_from_requests)):
+    await database.add_signal_async(signal=signal, session=session)
     return f"{signal.unique_name} 💾 ✅"
 
 @app.post("/addSource", include_in_schema=False)
 @app.post("/addSource/")
-def add_source(source:Source, token: str = Depends(get_token_from_requests)):
-    authdict = get_up_from_jwt_token(token)
-    session:Session = get_db_session_atomic(authdict['username'], authdict['password'])
-    database.add_source(source=source, session=session)
+async def add_source(source:Source, session: Session = Depends(get_session_from_requests)):
+    await database.add_source_async(source=source, session=session)
     return f"{source.unique_name} 💾 ✅"
 
+"""
+Answers a cached metadata listing, or 304 Not Modified if the client already has it
+"""
+def listing_response(body:bytes, etag:str, if_none_match:str|None) -> Response:
+    if(etag_matches(if_none_match, etag)):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @app.get("/listSources", include_in_schema=False)
 @app.get("/listSources/")
-def get_all_sources(token: str = Depends(get_token_from_requests)):
-    authdict = get_up_from_jwt_token(token)
-    sources = database.list_sources(session=get_db_session_atomic(authdict['username'], authdict['password']))
-    return sources
+async def get_all_sources(session: Session = Depends(get_session_from_requests), if_none_match: str|None = Header(default=None)):
+    catalog = await database.metadata_snapshot_async(session=session)
+    return listing_response(catalog.sources_body, catalog.sources_etag, if_none_match)
 
 @app.get("/listSignals", include_in_schema=False)
 @app.get("/listSignals/")
-def get_all_signals(source_name:str,token: str = Depends(get_token_from_requests)):
-    authdict = get_up_from_jwt_token(token)
-    signals = database.list_signals(source_name=source_name, session=get_db_session_atomic(authdict['username'], authdict['password']))
-    return signals
+async def get_all_signals(source_name:str,session: Session = Depends(get_session_from_requests), if_none_match: str|None = Header(default=None)):
+    catalog = await database.metadata_snapshot_async(session=session)
+    body, etag = catalog.signals_listing(source_name)
+    return listing_response(body, etag, if_none_match)
 
 @app.put("/writeTimeseriesData/{source_name}/{signal_name}", include_in_schema=False)
 @app.put("/writeTimeseriesData/{source_name}/{signal_name}/")
-def put_timeseries(source_name:str, signal_name:str, timeseries:Timeseries, token: str = Depends(get_token_from_requests)):
-    authdict = get_up_from_jwt_token(token)
-    applied = database.write_timeseries(source_name=source_name, signal_name=signal_name, timeseries=timeseries, session=get_db_session_atomic(authdict['username'], authdict['password']))
-    if(applied):
+async def put_timeseries(source_name:str, signal_name:str, timeseries:Timeseries, session: Session = Depends(get_session_from_requests)):
+    # Writes larger than the whole buffer could never be queued, they are written right away
+    if(ingest_buffer is not None) and (ingest_buffer.fits(len(timeseries.tsPoints))):
+        database.check_datatype(source_name=source_name, signal_name=signal_name, datatype=timeseries.datatype, session=session)
+        # Points are checked before they are acknowledged, a flush could only log them
+        failures = database.invalid_points(source_name=source_name, signal_name=signal_name, timeseries=timeseries, session=session)
+        if(failures):
+            return JSONResponse(status_code=400, content=WriteResult(applied=False, points_written=0, failures=failures).model_dump(mode="json"))
+        if(not ingest_buffer.enqueue(source_name=source_name, signal_name=signal_name, timeseries=timeseries, session=session)):
+            raise HTTPException(status_code=429, detail="Ingest buffer is full, retry later", headers={"Retry-After": str(max(1, round(INGEST_BUFFER_FLUSH_INTERVAL_SEK)))})
+        # Accepted, the points are written by the next flush of the buffer
+        return JSONResponse(status_code=202, content=f"{source_name} {signal_name} 📥 ✅")
+    result = await database.write_timeseries_async(source_name=source_name, signal_name=signal_name, timeseries=timeseries, session=session)
+    if(result.applied):
         return f"{source_name} {signal_name} 💾 ✅"
     else:
-        return f"{source_name} {signal_name} 💾 ❌"
+        # Multi-Status, the body lists the points that could not be written
+        return JSONResponse(status_code=207, content=result.model_dump(mode="json"))
+
+# Timeseries and its parts are components of the schema through the single write endpoint
+SIGNAL_WRITE_SCHEMA = {key: value for key, value in SignalWrite.model_json_schema(ref_template="#/components/schemas/{model}").items() if key != "$defs"}
+BULK_WRITE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": SIGNAL_WRITE_SCHEMA}},
+            MEDIA_TYPE_MSGPACK: {"schema": {"type": "string", "format": "binary"}},
+        },
+    },
+}
+
+"""
+Writes or enqueues one entry of a bulk write, failures are reported in the entry result
+"""
+async def write_bulk_entry(index:int, entry:SignalWrite, session:Session, limit:asyncio.Semaphore) -> BulkWriteEntryResult:
+    entry_id = dict(index=index, source_name=entry.source_name, signal_name=entry.signal_name)
+    if(ingest_buffer is not None) and (ingest_buffer.fits(len(entry.timeseries.tsPoints))):
+        try:
+            database.check_datatype(source_name=entry.source_name, signal_name=entry.signal_name, datatype=entry.timeseries.datatype, session=session)
+        except DatatypeMismatchError as exc:
+            return BulkWriteEntryResult(**entry_id, status=400, error=str(exc))
+        failures = database.invalid_points(source_name=entry.source_name, signal_name=entry.signal_name, timeseries=entry.timeseries, session=session)
+        if(failures):
+            return BulkWriteEntryResult(**entry_id, status=400, error=f"{len(failures)} points do not fit the datatype of the signal", result=WriteResult(applied=False, points_written=0, failures=failures))
+        if(not ingest_buffer.enqueue(source_name=entry.source_name, signal_name=entry.signal_name, timeseries=entry.timeseries, session=session)):
+            return BulkWriteEntryResult(**entry_id, status=429, error="Ingest buffer is full, retry later")
+        return BulkWriteEntryResult(**entry_id, status=202)
+    async with limit:
+        try:
+            result = await database.write_timeseries_async(source_name=entry.source_name, signal_name=entry.signal_name, timeseries=entry.timeseries, session=session)
+        except DatatypeMismatchError as exc:
+            return BulkWriteEntryResult(**entry_id, status=400, error=str(exc))
+        except Exception as exc:
+            log.exception(f"Bulk write of {entry.source_name} {entry.signal_name} failed.")
+            return BulkWriteEntryResult(**entry_id, status=500, error=str(exc))
+    return BulkWriteEntryResult(**entry_id, status=200 if result.applied else 207, result=result)
+
+"""
+Writes the timeseries of many signals with one request. The body is a list of SignalWrite
+as JSON or msgpack (Content-Type: application/msgpack), it is validated completely before
+anything is written. Entries are written concurrently, at most WRITE_CONCURRENCY at once.
+Answers one result per entry, with status 207 if not every entry was written (or queued).
+"""
+@app.post("/writeTimeseriesDataBulk", include_in_schema=False)
+@app.post("/writeTimeseriesDataBulk/", openapi_extra=BULK_WRITE_BODY, response_model=list[BulkWriteEntryResult])
+async def put_timeseries_bulk(request:Request, session: Session = Depends(get_session_from_requests)):
+    try:
+        entries = decode_signal_writes(await request.body(), request.headers.get("content-type"))
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False))
+    results:dict[int, BulkWriteEntryResult] = dict()
+    valid = list()
+    for index, entry in enumerate(entries):
+        try:
+            clean_name(entry.source_name)
+            clean_name(entry.signal_name)
+            valid.append(index)
+        except InvalidNameError as exc:
+            results[index] = BulkWriteEntryResult(index=index, source_name=entry.source_name, signal_name=entry.signal_name, status=400, error=str(exc))
+    limit = asyncio.Semaphore(WRITE_CONCURRENCY)
+    written = await asyncio.gather(*(write_bulk_entry(index, entries[index], session, limit) for index in valid))
+    results.update(zip(valid, written))
+    content = [results[index].model_dump(mode="json") for index in range(len(entries))]
+    all_done = all(result.status in (200, 202) for result in results.values())
+    return JSONResponse(status_code=200 if all_done else 207, content=content)
 
 @app.get("/readTimeseriesData/{source_name}/{signal_name}", include_in_schema = False)
 @app.get("/readTimeseriesData/{source_name}/{signal_name}/")
-def get_timeseries(source_name:str, signal_name:str, start_time:datetime, end_time:datetime, token: str = Depends(get_token_from_requests)):
-    authdict = get_up_from_jwt_token(token)
-    if(start_time.date()!=end_time.date()):
-        raise HTTPException(status_code=400, detail="start_time and end_time must be on the same date")
-    else:
-        timeseries_tpl = database.read_timeseries(source_name=source_name, signal_name=signal_name, start_time= start_time, end_time=end_time, session=get_db_session_atomic(authdict['username'], authdict['password']))
-        return timeseries_tpl
+async def get_timeseries(source_name:str, signal_name:str, start_time:datetime, end_time:datetime, session: Session = Depends(get_session_from_requests), accept: str|None = Header(default=None)):
+    if(as_utc(start_time) > as_utc(end_time)):
+        raise HTTPException(status_code=400, detail="start_time must not be after end_time")
+    # Columnar formats are opt-in via the Accept header, the tuple of three Timeseries stays the default
+    media_type = negotiate_media_type(accept)
+    if(media_type is not None):
+        columns = await database.read_timeseries_columnar_async(source_name=source_name, signal_name=signal_name, start_time=start_time, end_time=end_time, session=session)
+        with stage("read_timeseries_columnar", "encode"):
+            content = encode(columns, media_type)
+        return Response(content=content, media_type=media_type)
+    timeseries_tpl = await database.read_timeseries_async(source_name=source_name, signal_name=signal_name, start_time= start_time, end_time=end_time, session=session)
+    return timeseries_tpl
     
+class StreamFormat(Enum):
+    NDJSON = "ndjson"
+    COLUMNAR = "columnar"
+
+STREAM_ENCODERS = {
+    StreamFormat.NDJSON: (encode_ndjson_rows, "application/x-ndjson"),
+    StreamFormat.COLUMNAR: (encode_columnar_block, "application/x-ndjson"),
+}
+
+"""
+Streams a timeseries in ascending time order while it is paged out of the database.
+ndjson sends one point per line, columnar one block of column arrays per page.
+"""
+@app.get("/streamTimeseriesData/{source_name}/{signal_name}", include_in_schema = False)
+@app.get("/streamTimeseriesData/{source_name}/{signal_name}/")
+async def stream_timeseries(source_name:str, signal_name:str, start_time:datetime, end_time:datetime, format:StreamFormat = StreamFormat.NDJSON, fetch_size:int|None = None, lease: SessionLease = Depends(get_lease_from_requests)):
+    # The body is sent after the request's dependencies finished, so the session stays borrowed until it is done
+    try:
+        if(as_utc(start_time) > as_utc(end_time)):
+            raise HTTPException(status_code=400, detail="start_time must not be after end_time")
+        if(fetch_size is not None and fetch_size <= 0):
+            raise HTTPException(status_code=400, detail="fetch_size must be positive")
+        encoder, media_type = STREAM_ENCODERS[format]
+        session = lease.session
+        datatype = datatype_name(database.stored_datatype(source_name=source_name, signal_name=signal_name, session=session))
+        pages = await database.open_timeseries_pages_async(source_name=source_name, signal_name=signal_name, start_time=start_time, end_time=end_time, session=session, fetch_size=fetch_size or STREAM_FETCH_SIZE)
+    except BaseException:
+        lease.release()
+        raise
+    return StreamingResponse(stream_pages(pages, encoder, datatype, lease), media_type=media_type, background=BackgroundTask(lease.release))
+
+"""Encodes the pages of a stream and releases its session once the stream ended or failed"""
+async def stream_pages(pages, encoder, datatype:str, lease:SessionLease):
+    try:
+        async for rows in pages:
+            yield encoder(rows, datatype)
+    finally:
+        lease.release()
+
+@app.get("/readTimeseriesAggregated/{source_name}/{signal_name}", include_in_schema = False)
+@app.get("/readTimeseriesAggregated/{source_name}/{signal_name}/")
+async def get_timeseries_aggregated(source_name:str, signal_name:str, start_time:datetime, end_time:datetime, mode:AggregationMode = AggregationMode.BUCKETS, bucket_seconds:float|None = None, points:int|None = None, session: Session = Depends(get_session_from_requests)):
+    if(as_utc(start_time) > as_utc(end_time)):
+        raise HTTPException(status_code=400, detail="start_time must not be after end_time")
+    if(bucket_seconds is None and points is None):
+        raise HTTPException(status_code=400, detail="Either bucket_seconds or points must be provided")
+    if((bucket_seconds is not None and bucket_seconds <= 0) or (points is not None and points <= 0)):
+        raise HTTPException(status_code=400, detail="bucket_seconds and points must be positive")
+    if(mode == AggregationMode.LTTB and points is not None and points < 3):
+        raise HTTPException(status_code=400, detail="LTTB needs at least 3 points")
+    bucket_ms = max(1, int(bucket_seconds * 1000)) if bucket_seconds is not None else None
+    return await database.read_timeseries_aggregated_async(source_name=source_name, signal_name=signal_name, start_time=start_time, end_time=end_time, session=session, mode=mode, bucket_ms=bucket_ms, points=points)
+
+"""
+Reads many signals over the same time range with one request, all signals are queried
+concurrently within the READ_CONCURRENCY limit of the request. Without alignment every
+signal is answered with its own columns, with alignment=ffill or alignment=bucket the
+numeric signals are put on a common grid of bucket_seconds wide slots and answered as one
+matrix with a row per signal.
+"""
+@app.post("/readTimeseriesDataMulti", include_in_schema = False)
+@app.post("/readTimeseriesDataMulti/")
+async def get_timeseries_multi(read:MultiSignalRead, session: Session = Depends(get_session_from_requests)):
+    if(as_utc(read.start_time) > as_utc(read.end_time)):
+        raise HTTPException(status_code=400, detail="start_time must not be after end_time")
+    if(len(read.signals) > MAX_MULTI_SIGNALS):
+        raise HTTPException(status_code=400, detail=f"At most {MAX_MULTI_SIGNALS} signals can be read with one request")
+    signal_keys = [(signal.source_name, signal.signal_name) for signal in read.signals]
+    if(read.alignment == Alignment.NONE):
+        columns = await database.read_timeseries_multi_columnar_async(signals=read.signals, start_time=read.start_time, end_time=read.end_time, session=session)
+        with stage("read_timeseries_multi", "encode"):
+            content = encode_multi_json(signal_keys, columns)
+        return Response(content=content, media_type=MEDIA_TYPE_COLUMNAR_JSON)
+    if(read.bucket_seconds is None or read.bucket_seconds <= 0):
+        raise HTTPException(status_code=400, detail="A positive bucket_seconds is required for aligned reads")
+    bucket_ms = max(1, int(read.bucket_seconds * 1000))
+    window_ms = (as_utc(read.end_time) - as_utc(read.start_time)).total_seconds() * 1000
+    if((window_ms // bucket_ms + 1) * max(1, len(read.signals)) > MAX_ALIGNED_POINTS):
+        raise HTTPException(status_code=400, detail=f"The aligned result would exceed {MAX_ALIGNED_POINTS} values, increase bucket_seconds")
+    aligned = await database.read_timeseries_aligned_async(signals=read.signals, start_time=read.start_time, end_time=read.end_time, session=session, alignment=read.alignment, bucket_ms=bucket_ms)
+    with stage("read_timeseries_aligned", "encode"):
+        content = encode_aligned_json(aligned)
+    return Response(content=content, media_type=MEDIA_TYPE_COLUMNAR_JSON)
+
 @app.get("/getLastDataPoint/{source_name}/{signal_name}", include_in_schema = False)
 @app.get("/getLastDataPoint/{source_name}/{signal_name}/")
-def get_last_dp(source_name:str, signal_name:str, token: str = Depends(get_token_from_requests)):
-    authdict = get_up_from_jwt_token(token)
-    dp = database.read_latest_dp(source_name=source_name, signal_name=signal_name, session=get_db_session_atomic(authdict['username'], authdict['password']))
+async def get_last_dp(source_name:str, signal_name:str, session: Session = Depends(get_session_from_requests)):
+    dp = await database.read_latest_dp_async(source_name=source_name, signal_name=signal_name, session=session)
     return dp
 
+@app.post("/getLastDataPoints", include_in_schema = False)
+@app.post("/getLastDataPoints/")
+async def get_last_dps(signals:list[SignalRef], session: Session = Depends(get_session_from_requests)):
+    return await database.read_latest_dps_async(signals=signals, session=session)
+
+@app.get("/getLastDataPoints/{source_name}", include_in_schema = False)
+@app.get("/getLastDataPoints/{source_name}/")
+async def get_last_dps_of_source(source_name:str, session: Session = Depends(get_session_from_requests)):
+    signals = await database.list_signals_async(source_name=source_name, session=session)
+    return await database.read_latest_dps_async(signals=[SignalRef(source_name=source_name, signal_name=signal.unique_name) for signal in signals], session=session)
+
+"""
+Creates the database structure once and serves the api. With API_WORKERS > 1 uvicorn starts
+that many worker processes, each imports the app and connects its own sessions and caches,
+nothing is shared between them but the listening socket and the metrics directory.
+On SIGTERM every worker stops accepting connections, waits up to SHUTDOWN_TIMEOUT_SEK for
+the requests in flight and then writes out its ingest buffer before exiting.
+"""
 def main():
+    # A configured metrics directory is prepared even for a single worker, its process already shares metrics through it
+    if(API_WORKERS > 1) or ("PROMETHEUS_MULTIPROC_DIR" in os.environ):
+        prepare_multiprocess_dir(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
     if("CASSANDRA_USERNAME" in os.environ) and ("CASSANDRA_PASSWORD" in os.environ):
         database.ensure_database_structure(get_db_session_atomic(os.environ.get("CASSANDRA_USERNAME"), os.environ.get("CASSANDRA_PASSWORD")))
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("API_PORT")))
+    if(API_WORKERS <= 1):
+        uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("API_PORT")), timeout_graceful_shutdown=SHUTDOWN_TIMEOUT_SEK)
+        return
+    # The workers connect on their own, the connections of this process would only idle
+    session_manager.shutdown()
+    uvicorn.run("api_main:app", app_dir=os.path.dirname(os.path.abspath(__file__)), host="0.0.0.0", port=int(os.environ.get("API_PORT")), workers=API_WORKERS, timeout_graceful_shutdown=SHUTDOWN_TIMEOUT_SEK)
 
 if(__name__ == '__main__'):
     main()
\ No newline at end of file
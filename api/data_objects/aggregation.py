@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+from enum import Enum
+from pydantic import BaseModel
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MS = timedelta(milliseconds=1)
+
+"""How a timeseries is reduced before it is sent to a visualiser"""
+class AggregationMode(Enum):
+    BUCKETS = "buckets"
+    LTTB = "lttb"
+
+"""Aggregates per time bucket, timestamps are the bucket starts in epoch milliseconds"""
+class AggregatedTimeseries(BaseModel):
+    bucket_ms:int
+    timestamps:list[int]
+    min:list[float]
+    max:list[float]
+    mean:list[float]
+    count:list[int]
+    first:list[float]
+    last:list[float]
+
+"""A downsampled timeseries, timestamps are epoch milliseconds"""
+class DownsampledTimeseries(BaseModel):
+    timestamps:list[int]
+    values:list[float]
+
+"""Raised if a signal can not be aggregated, e.g. because it holds text values"""
+class UnsupportedDatatypeError(ValueError):
+    pass
+
+"""
+Converts driver rows into an ascending int64 epoch-ms array and a float64 value array.
+Rows are expected newest first, like they are stored in the data tables. datatype is set for
+rows of typed data tables, their value column is read without checking every row.
+"""
+def rows_to_arrays(rows:list, datatype:str|None = None) -> tuple:
+    if datatype == "STRING":
+        raise UnsupportedDatatypeError("Only INT and FLOAT signals can be aggregated")
+    count = len(rows)
+    # The driver returns naive UTC datetimes, timedelta arithmetic is much faster than datetime64 parsing
+    timestamps = np.fromiter(((row.event_time - EPOCH) // ONE_MS for row in reversed(rows)), dtype=np.int64, count=count)
+    if datatype is not None:
+        values = np.fromiter((row.value for row in reversed(rows)), dtype=np.float64, count=count)
+    else:
+        values = np.fromiter((numeric_value(row) for row in reversed(rows)), dtype=np.float64, count=count)
+    return timestamps, values
+
+def numeric_value(row) -> int|float:
+    if row.value_float is not None:
+        return row.value_float
+    if row.value_int is not None:
+        return row.value_int
+    raise UnsupportedDatatypeError("Only INT and FLOAT signals can be aggregated")
+
+"""
+Aggregates ascending timestamps/values into buckets of bucket_ms starting at start_ms.
+Empty buckets are left out.
+"""
+def bucket_aggregate(timestamps:np.ndarray, values:np.ndarray, start_ms:int, bucket_ms:int) -> AggregatedTimeseries:
+    if len(timestamps) == 0:
+        return AggregatedTimeseries(bucket_ms=bucket_ms, timestamps=[], min=[], max=[], mean=[], count=[], first=[], last=[])
+    bucket_ids = (timestamps - start_ms) // bucket_ms
+    # The input is sorted, so the first index of every bucket id is the start of its run
+    buckets, starts, counts = np.unique(bucket_ids, return_index=True, return_counts=True)
+    sums = np.add.reduceat(values, starts)
+    return AggregatedTimeseries(
+        bucket_ms=bucket_ms,
+        timestamps=(start_ms + buckets * bucket_ms).tolist(),
+        min=np.minimum.reduceat(values, starts).tolist(),
+        max=np.maximum.reduceat(values, starts).tolist(),
+        mean=(sums / counts).tolist(),
+        count=counts.tolist(),
+        first=values[starts].tolist(),
+        last=values[starts + counts - 1].tolist(),
+    )
+
+"""
+Largest-Triangle-Three-Buckets downsampling of ascending timestamps/values to at most
+threshold points. The first and last point are always kept, a threshold below 3 keeps
+only them (or only the first point for a threshold of 1).
+"""
+def lttb(timestamps:np.ndarray, values:np.ndarray, threshold:int) -> DownsampledTimeseries:
+    count = len(timestamps)
+    if threshold >= count:
+        return DownsampledTimeseries(timestamps=timestamps.tolist(), values=values.tolist())
+    if threshold < 3:
+        selected = np.array([0, count - 1][:max(threshold, 0)], dtype=np.int64)
+        return DownsampledTimeseries(timestamps=timestamps[selected].tolist(), values=values[selected].tolist())
+    x = timestamps.astype(np.float64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    # Bucket edges for the points between the first and the last one
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+            avg_x = x[next_start:next_end].mean()
+            avg_y = values[next_start:next_end].mean()
+        else:
+            avg_x = x[-1]
+            avg_y = values[-1]
+        areas = np.abs((x[previous] - avg_x) * (values[start:end] - values[previous]) - (x[previous] - x[start:end]) * (avg_y - values[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return DownsampledTimeseries(timestamps=timestamps[selected].tolist(), values=values[selected].tolist())
+
+"""How the signals of a multi signal read are put on a common time grid"""
+class Alignment(Enum):
+    NONE = "none"
+    FFILL = "ffill"
+    BUCKET = "bucket"
+
+"""The grid timestamps of an aligned read: every bucket_ms from start_ms up to end_ms"""
+def time_grid(start_ms:int, end_ms:int, bucket_ms:int) -> np.ndarray:
+    return np.arange(start_ms, end_ms + 1, bucket_ms, dtype=np.int64)
+
+"""Samples ascending timestamps/values at the grid with the last value at or before every grid timestamp, NaN before the first point"""
+def align_ffill(timestamps:np.ndarray, values:np.ndarray, grid:np.ndarray) -> np.ndarray:
+    positions = np.searchsorted(timestamps, grid, side="right") - 1
+    aligned = np.full(len(grid), np.nan)
+    sampled = positions >= 0
+    aligned[sampled] = values[positions[sampled]]
+    return aligned
+
+"""Averages ascending timestamps/values per grid bucket of bucket_ms, NaN for empty buckets"""
+def align_buckets(timestamps:np.ndarray, values:np.ndarray, grid:np.ndarray, bucket_ms:int) -> np.ndarray:
+    bucket_ids = (timestamps - grid[0]) // bucket_ms if len(grid) else timestamps
+    in_grid = (bucket_ids >= 0) & (bucket_ids < len(grid))
+    sums = np.bincount(bucket_ids[in_grid], weights=values[in_grid], minlength=len(grid))
+    counts = np.bincount(bucket_ids[in_grid], minlength=len(grid))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
@@ -0,0 +1,83 @@
+"""
+Bridges cassandra driver ResponseFutures into asyncio. The driver completes futures on its
+own event loop thread, the callbacks hand the result over to the asyncio loop.
+"""
+from cassandra.cluster import Session, ResponseFuture
+import asyncio
+
+def _next_page(response_future:ResponseFuture) -> asyncio.Future:
+    loop = asyncio.get_running_loop()
+    page = loop.create_future()
+
+    def set_result(rows):
+        if not page.done():
+            page.set_result(rows)
+
+    def set_exception(exc):
+        if not page.done():
+            page.set_exception(exc)
+
+    # Callbacks stay registered on the driver future, old ones must not fire for the next page
+    response_future.clear_callbacks()
+    response_future.add_callbacks(
+        callback=lambda rows: loop.call_soon_threadsafe(set_result, rows),
+        errback=lambda exc: loop.call_soon_threadsafe(set_exception, exc),
+    )
+    return page
+
+"""Awaits all pages of a started query and returns their rows"""
+async def fetch_all(response_future:ResponseFuture) -> list:
+    rows = list(await _next_page(response_future))
+    while response_future.has_more_pages:
+        response_future.start_fetching_next_page()
+        rows.extend(await _next_page(response_future))
+    return rows
+
+"""Yields the rows of a started query page by page, the next page is only requested when the previous one was consumed"""
+async def iter_pages(response_future:ResponseFuture):
+    rows = await _next_page(response_future)
+    while True:
+        yield rows
+        if not response_future.has_more_pages:
+            return
+        response_future.start_fetching_next_page()
+        rows = await _next_page(response_future)
+
+"""Asynchronous counterpart of session.execute(...).all()"""
+async def execute_async(session:Session, statement, parameters=None) -> list:
+    return await fetch_all(session.execute_async(statement, parameters))
+
+"""
+Asynchronous counterpart of cassandra.concurrent.execute_concurrent with raise_on_first_error=False:
+runs the statements with at most concurrency in flight and returns a (success, result_or_exc)
+tuple per statement, in the order of the statements. Calls given the same semaphore share
+its limit instead.
+"""
+async def execute_concurrent_async(session:Session, statements_and_parameters:list, concurrency:int, semaphore:asyncio.Semaphore|None = None) -> list:
+    semaphore = semaphore or asyncio.Semaphore(concurrency)
+
+    async def run(statement, parameters):
+        async with semaphore:
+            try:
+                return (True, await execute_async(session, statement, parameters))
+            except Exception as exc:
+                return (False, exc)
+
+    return await asyncio.gather(*(run(statement, parameters) for statement, parameters in statements_and_parameters))
+
+"""
+Coalesces concurrent calls with the same key: while a call is in flight, every other caller
+with that key awaits the same result instead of starting its own query.
+"""
+class SingleFlight:
+    def __init__(self):
+        self.__in_flight__:dict = dict()
+
+    async def run(self, key, factory):
+        task = self.__in_flight__.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(factory())
+            self.__in_flight__[key] = task
+            task.add_done_callback(lambda done: self.__in_flight__.pop(key, None) if self.__in_flight__.get(key) is done else None)
+        # Shielded, so one cancelled caller does not cancel the query for the others
+        return await asyncio.shield(task)
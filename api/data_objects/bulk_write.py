@@ -0,0 +1,39 @@
+from data_objects.database_objects import SignalWrite
+from pydantic import TypeAdapter
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MEDIA_TYPE_JSON = "application/json"
+MEDIA_TYPE_MSGPACK = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MEDIA_TYPE_MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+SIGNAL_WRITES = TypeAdapter(list[SignalWrite])
+
+"""Raised if a request body is sent in a format that can not be decoded"""
+class UnsupportedMediaTypeError(ValueError):
+    pass
+
+"""Raised if a request body can not be parsed in its declared format"""
+class MalformedBodyError(ValueError):
+    pass
+
+"""
+Decodes and validates the body of a bulk write in one pass. JSON is validated directly by
+pydantic, msgpack bodies have the same structure and may send timestamps as msgpack
+timestamp extension, ISO strings or unix seconds. Raises pydantic's ValidationError.
+"""
+def decode_signal_writes(body:bytes, content_type:str|None) -> list[SignalWrite]:
+    media_type = (content_type or MEDIA_TYPE_JSON).split(";")[0].strip().lower()
+    if media_type in MSGPACK_MEDIA_TYPES:
+        if msgpack is None:
+            raise UnsupportedMediaTypeError("msgpack bodies require msgpack to be installed")
+        try:
+            entries = msgpack.unpackb(body, timestamp=3)
+        except ValueError as exc:
+            raise MalformedBodyError(f"Body is no valid msgpack: {exc}")
+        return SIGNAL_WRITES.validate_python(entries)
+    if media_type != MEDIA_TYPE_JSON:
+        raise UnsupportedMediaTypeError(f"Unsupported content type {media_type}, use {MEDIA_TYPE_JSON} or {MEDIA_TYPE_MSGPACK}")
+    return SIGNAL_WRITES.validate_json(body)
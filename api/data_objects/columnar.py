@@ -0,0 +1,160 @@
+from data_objects.aggregation import EPOCH, ONE_MS
+import json, struct
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+MEDIA_TYPE_COLUMNAR_JSON = "application/vnd.timeseries.columnar+json"
+MEDIA_TYPE_BINARY = "application/octet-stream"
+MEDIA_TYPE_ARROW = "application/vnd.apache.arrow.stream"
+COLUMNAR_MEDIA_TYPES = (MEDIA_TYPE_COLUMNAR_JSON, MEDIA_TYPE_BINARY, MEDIA_TYPE_ARROW)
+# Little-endian header of the binary format: magic, version, datatype code, point count
+BINARY_HEADER = struct.Struct("<4sBBxxQ")
+BINARY_MAGIC = b"TSCB"
+BINARY_DATATYPE_CODES = {"INT": 1, "FLOAT": 2}
+
+"""Raised if a timeseries can not be encoded in the requested format"""
+class UnsupportedEncodingError(ValueError):
+    pass
+
+"""
+A timeseries as column arrays: ascending epoch-ms timestamps and their values.
+Values are a NumPy array for INT/FLOAT and a list of strings for STRING signals.
+"""
+class ColumnarTimeseries:
+    __slots__ = ("datatype", "timestamps", "values")
+    def __init__(self, datatype:str, timestamps:np.ndarray, values):
+        self.datatype = datatype
+        self.timestamps = timestamps
+        self.values = values
+
+"""
+Many signals sampled on a common grid of ascending epoch-ms timestamps. values is a float64
+matrix with one row per signal and NaN where a signal has no value. signals holds the
+(source_name, signal_name) of every row.
+"""
+class AlignedColumns:
+    __slots__ = ("signals", "timestamps", "values")
+    def __init__(self, signals:list, timestamps:np.ndarray, values:np.ndarray):
+        self.signals = signals
+        self.timestamps = timestamps
+        self.values = values
+
+"""
+Builds the columns directly from driver rows, which are ordered newest first unless newest_first
+is False. Rows of a typed data table are decoded as its datatype from their value column.
+"""
+def rows_to_columnar(rows:list, datatype:str|None = None, newest_first:bool = True) -> ColumnarTimeseries:
+    count = len(rows)
+    ordered = rows[::-1] if newest_first else rows
+    timestamps = np.fromiter(((row.event_time - EPOCH) // ONE_MS for row in ordered), dtype=np.int64, count=count)
+    if datatype == "STRING":
+        return ColumnarTimeseries(datatype, timestamps, [row.value for row in ordered])
+    if datatype is not None:
+        return ColumnarTimeseries(datatype, timestamps, np.fromiter((row.value for row in ordered), dtype=np.int64 if datatype == "INT" else np.float64, count=count))
+    values = [row.value_int if row.value_int is not None else row.value_float if row.value_float is not None else row.value_text for row in ordered]
+    if any(row.value_text is not None for row in rows):
+        return ColumnarTimeseries("STRING", timestamps, [None if value is None else str(value) for value in values])
+    if any(row.value_float is not None for row in rows):
+        return ColumnarTimeseries("FLOAT", timestamps, np.array(values, dtype=np.float64))
+    return ColumnarTimeseries("INT", timestamps, np.array(values, dtype=np.int64))
+
+"""Returns the columnar media type of the Accept header, or None if the default format was asked for"""
+def negotiate_media_type(accept:str|None) -> str|None:
+    if not accept:
+        return None
+    for media_range in accept.split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in COLUMNAR_MEDIA_TYPES:
+            return media_type
+    return None
+
+def encode_json(columns:ColumnarTimeseries) -> bytes:
+    content = {"datatype": columns.datatype, "timestamps": columns.timestamps, "values": columns.values}
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    content["timestamps"] = columns.timestamps.tolist()
+    if isinstance(columns.values, np.ndarray):
+        content["values"] = columns.values.tolist()
+    return json.dumps(content, separators=(",", ":")).encode("utf-8")
+
+"""
+Encodes a numeric timeseries as the binary header followed by the little-endian
+int64 timestamps and the int64 (INT) or float64 (FLOAT) values.
+"""
+def encode_binary(columns:ColumnarTimeseries) -> bytes:
+    if columns.datatype not in BINARY_DATATYPE_CODES:
+        raise UnsupportedEncodingError("Only INT and FLOAT signals can be encoded as binary")
+    value_dtype = "<i8" if columns.datatype == "INT" else "<f8"
+    header = BINARY_HEADER.pack(BINARY_MAGIC, 1, BINARY_DATATYPE_CODES[columns.datatype], len(columns.timestamps))
+    return header + columns.timestamps.astype("<i8").tobytes() + columns.values.astype(value_dtype).tobytes()
+
+"""Encodes the timeseries as an Apache Arrow IPC stream with the columns timestamp and value"""
+def encode_arrow(columns:ColumnarTimeseries) -> bytes:
+    if pyarrow is None:
+        raise UnsupportedEncodingError("Arrow encoding is not available, pyarrow is not installed")
+    table = pyarrow.table({
+        "timestamp": pyarrow.array(columns.timestamps, type=pyarrow.timestamp("ms", tz="UTC")),
+        "value": pyarrow.array(columns.values),
+    })
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+"""Encodes driver rows as one {"timestamp": epoch-ms, "value": ...} JSON object per line, datatype is set for rows of typed data tables"""
+def encode_ndjson_rows(rows:list, datatype:str|None = None) -> bytes:
+    if datatype is not None:
+        lines = [{"timestamp": (row.event_time - EPOCH) // ONE_MS, "value": row.value} for row in rows]
+    else:
+        lines = list()
+        for row in rows:
+            value = row.value_int if row.value_int is not None else row.value_float if row.value_float is not None else row.value_text
+            lines.append({"timestamp": (row.event_time - EPOCH) // ONE_MS, "value": value})
+    if orjson is not None:
+        return b"".join(orjson.dumps(line) + b"\n" for line in lines)
+    return "".join(json.dumps(line, separators=(",", ":")) + "\n" for line in lines).encode("utf-8")
+
+"""Encodes ascending driver rows as one columnar JSON block terminated by a newline"""
+def encode_columnar_block(rows:list, datatype:str|None = None) -> bytes:
+    return encode_json(rows_to_columnar(rows, datatype, newest_first=False)) + b"\n"
+
+def signal_json(source_name:str, signal_name:str) -> dict:
+    return {"source_name": source_name, "signal_name": signal_name}
+
+"""Encodes the columns of many signals as {"signals": [{"source_name", "signal_name", "datatype", "timestamps", "values"}, ...]}"""
+def encode_multi_json(signals:list, columns:list) -> bytes:
+    content = {"signals": [dict(signal_json(*signal), datatype=column.datatype, timestamps=column.timestamps, values=column.values) for signal, column in zip(signals, columns)]}
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    for entry in content["signals"]:
+        entry["timestamps"] = entry["timestamps"].tolist()
+        if isinstance(entry["values"], np.ndarray):
+            entry["values"] = entry["values"].tolist()
+    return json.dumps(content, separators=(",", ":")).encode("utf-8")
+
+"""Encodes aligned signals as {"signals": [...], "timestamps": [...], "values": [[...], ...]} with null for missing values"""
+def encode_aligned_json(aligned:AlignedColumns) -> bytes:
+    signals = [signal_json(*signal) for signal in aligned.signals]
+    if orjson is not None:
+        # orjson writes NaN as null
+        return orjson.dumps({"signals": signals, "timestamps": aligned.timestamps, "values": aligned.values}, option=orjson.OPT_SERIALIZE_NUMPY)
+    values = np.where(np.isnan(aligned.values), None, aligned.values).tolist()
+    return json.dumps({"signals": signals, "timestamps": aligned.timestamps.tolist(), "values": values}, separators=(",", ":")).encode("utf-8")
+
+ENCODERS = {
+    MEDIA_TYPE_COLUMNAR_JSON: encode_json,
+    MEDIA_TYPE_BINARY: encode_binary,
+    MEDIA_TYPE_ARROW: encode_arrow,
+}
+
+def encode(columns:ColumnarTimeseries, media_type:str) -> bytes:
+    return ENCODERS[media_type](columns)
@@ -1,21 +1,125 @@
 from cassandra.cluster import Session, ResultSet
 from cassandra import ConsistencyLevel
-from cassandra.query import SimpleStatement
-from datetime import datetime, date
+from cassandra.query import PreparedStatement, BatchStatement, BatchType, SimpleStatement, UNSET_VALUE
+from cassandra.concurrent import execute_concurrent
+from datetime import datetime, date, timedelta
 from enum import Enum
 from pydantic import BaseModel
-import logging, pytz
+from data_objects.statement_cache import StatementCache
+from data_objects.async_bridge import execute_async, execute_concurrent_async, iter_pages, SingleFlight
+from data_objects.metadata_catalog import MetadataCatalog, CatalogSnapshot
+from data_objects.latest_dp_cache import LatestPointCache, utc_naive
+from data_objects.hot_window import HotWindowCache, HotRow, TypedHotRow, TAIL_OVERLAP, utc_now
+from data_objects.table_registry import TableRegistry
+from data_objects.metrics import stage, observe_rows, count_points
+from data_objects.rollup_scheduler import RollupScheduler
+from data_objects.session_manager import SessionManager
+from data_objects.rollups import ROLLUP_LEVELS, RollupLevel, Rollups, affected_buckets, source_ranges, plan_rollup_read, as_datetime, ms_of
+from data_objects.columnar import ColumnarTimeseries, AlignedColumns, rows_to_columnar
+from data_objects.aggregation import EPOCH, ONE_MS, UnsupportedDatatypeError, AggregationMode, AggregatedTimeseries, DownsampledTimeseries, Alignment, rows_to_arrays, bucket_aggregate, lttb, time_grid, align_ffill, align_buckets
+import numpy as np
+import asyncio, logging, math, pytz, re
 SOURCE_METADATA_TABLE = "meta_sources"
 SIGNAL_METADATA_TABLE = "meta_signals"
 SIGNAL_LAST_DP_TABLE = "latest_dp_signals"
 SIGNAL_INSTANCE_PREFIX = "data_"
+# Results with more rows are decoded in a worker thread by the async read methods
+DECODE_OFFLOAD_ROWS = 10000
+EPOCH_UTC = pytz.utc.localize(EPOCH)
 
 log = logging.getLogger()
+VALID_NAME_PATTERN = re.compile(r"^[a-z0-9]+$")
+
+"""Raised when a source or signal name can not be used as part of a table name"""
+class InvalidNameError(ValueError):
+    pass
+
+"""Raised when points are written to a typed data table of another datatype"""
+class DatatypeMismatchError(ValueError):
+    pass
+
+"""Returns the name as it is stored in the database: lowercase and without underscores"""
+def clean_name(name:str) -> str:
+    clean = name.lower().replace('_','')
+    if not VALID_NAME_PATTERN.match(clean):
+        raise InvalidNameError(f"'{name}' is not a valid source/signal name, only letters, digits and underscores are allowed")
+    return clean
+
+"""Returns the name of the data table of a signal"""
+def signal_table_name(source_name:str, signal_name:str) -> str:
+    return f"{SIGNAL_INSTANCE_PREFIX}{clean_name(source_name)}_{clean_name(signal_name)}"
+
 class TSType(Enum):
     INT = "INT"
     FLOAT = "FLOAT"
     STRING = "STRING"
+
+# CQL type of the value column of typed data tables per datatype, (default, wide values)
+VALUE_TYPES = {
+    TSType.INT: ("int", "bigint"),
+    TSType.FLOAT: ("float", "double"),
+    TSType.STRING: ("text", "text"),
+}
+DATATYPES_BY_VALUE_TYPE = {value_type: datatype for datatype, value_types in VALUE_TYPES.items() for value_type in value_types}
+LEGACY_VALUE_COLUMNS = {
+    TSType.INT: "value_int",
+    TSType.FLOAT: "value_float",
+    TSType.STRING: "value_text",
+}
+# Rows copied per round of a migration to typed tables
+MIGRATION_CHUNK_ROWS = 5000
+# Value ranges of the integer and float CQL types, the driver refuses values beyond them
+INTEGER_RANGES = {
+    "int": (-2**31, 2**31 - 1),
+    "bigint": (-2**63, 2**63 - 1),
+}
+FLOAT32_MAX = 3.4028234663852886e38
+
+"""Returns the datetime in UTC, naive datetimes are taken as UTC like the driver does"""
+def as_utc(timestamp:datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=pytz.utc)
+    return timestamp.astimezone(pytz.utc)
+
+"""Returns the (value_int, value_float, value_text) columns for a value of the given type"""
+def typed_values(datatype:TSType, value) -> tuple:
+    if(datatype == TSType.INT):
+        return (value, None, None)
+    elif(datatype == TSType.FLOAT):
+        return (None, value, None)
+    else:
+        return (None, None, value)
+
+"""
+Returns the values of the value_text, value_bigint and value_double columns of the latest
+datapoint table for a point. Numbers always use the 64 bit columns, so values of wide data
+tables fit without loss.
+"""
+def latest_values(datatype:TSType, value) -> tuple:
+    if(datatype == TSType.INT):
+        return (None, value, None)
+    elif(datatype == TSType.FLOAT):
+        return (None, None, value)
+    else:
+        return (value, None, None)
     
+"""Returns why the value can not be stored in a value column of the CQL type, None if it can"""
+def value_error(value, value_type:str) -> str|None:
+    if value_type in INTEGER_RANGES:
+        if not isinstance(value, int) or isinstance(value, bool):
+            return f"{value!r} is not an integer"
+        low, high = INTEGER_RANGES[value_type]
+        if not low <= value <= high:
+            return f"{value} is out of the range of the {value_type} column"
+    elif value_type in ("float", "double"):
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return f"{value!r} is not a number"
+        if value_type == "float" and math.isfinite(value) and abs(value) > FLOAT32_MAX:
+            return f"{value} is out of the range of the float column"
+    elif not isinstance(value, str):
+        return f"{value!r} is not a string"
+    return None
+
 """One singular datapoint"""
 class TSPoint(BaseModel):
     timestamp:datetime
@@ -25,11 +129,66 @@ class Timeseries(BaseModel):
     datatype:TSType
     tsPoints:list[TSPoint]
 
-"""A timeseries dataset container that resembles a singular timeseries like data of a single probe"""
+"""A point of a timeseries write that could not be persisted"""
+class PointFailure(BaseModel):
+    index:int
+    timestamp:datetime
+    error:str
+"""The outcome of a timeseries write, applied is only true if every point was written"""
+class WriteResult(BaseModel):
+    applied:bool
+    points_written:int
+    failures:list[PointFailure]
+
+"""One timeseries of a bulk write"""
+class SignalWrite(BaseModel):
+    source_name:str
+    signal_name:str
+    timeseries:Timeseries
+
+"""
+The outcome of one entry of a bulk write. status is the HTTP status the entry would have
+gotten as single write, error is set if the entry was rejected before it was written.
+"""
+class BulkWriteEntryResult(BaseModel):
+    index:int
+    source_name:str
+    signal_name:str
+    status:int
+    result:WriteResult|None = None
+    error:str|None = None
+
+"""The latest datapoint of a signal, point is None if the signal has no data"""
+class LatestDataPoint(BaseModel):
+    source_name:str
+    signal_name:str
+    point:TSPoint|None
+
+"""Identifies a signal of a source in bulk requests"""
+class SignalRef(BaseModel):
+    source_name:str
+    signal_name:str
+
+"""
+A read of many signals over the same time range. With an alignment other than none the
+signals are put on a common grid of bucket_seconds wide slots.
+"""
+class MultiSignalRead(BaseModel):
+    signals:list[SignalRef]
+    start_time:datetime
+    end_time:datetime
+    alignment:Alignment = Alignment.NONE
+    bucket_seconds:float|None = None
+
+"""
+A timeseries dataset container that resembles a singular timeseries like data of a single probe.
+The datatype is optional, if it is given the data table of the signal is created for it.
+"""
 class Signal(BaseModel):
     meta_info:str
     unique_name:str
     source_name:str
+    datatype:TSType|None = None
 
 """A device like a weather station"""
 class Source(BaseModel):
@@ -39,8 +198,52 @@ class Source(BaseModel):
 
 class Database:
     __keyspace_name__:str
-    def __init__(self, keyspace_name:str):
+    __statements__:StatementCache
+    __tables__:TableRegistry
+    __write_concurrency__:int
+    __write_batch_size__:int
+    __read_concurrency__:int
+    __session_manager__:SessionManager|None
+    __latest_dp_cache__:LatestPointCache|None
+    __catalog__:MetadataCatalog
+    __single_flight__:SingleFlight
+    __rollups_enabled__:bool
+    __rollup_scheduler__:RollupScheduler
+    __hot_windows__:HotWindowCache|None
+    __typed_tables__:bool
+    __wide_values__:bool
+    __data_ttl_sek__:int
+    __compaction_window_days__:int
+    def __init__(self, keyspace_name:str, write_concurrency:int = 32, write_batch_size:int = 100, read_concurrency:int = 16, latest_dp_ttl_sek:float = 0, metadata_refresh_sek:float = 30, rollups_enabled:bool = False, hot_window_sek:float = 0, hot_window_ttl_sek:float = 2, hot_window_max_points:int = 500000, hot_window_reload_sek:float = 300, typed_tables:bool = False, wide_values:bool = False, data_ttl_sek:int = 0, compaction_window_days:int = 1, rollup_delay_sek:float = 1.0, session_manager:SessionManager|None = None):
         self.__keyspace_name__ = keyspace_name.lower()
+        self.__statements__ = StatementCache()
+        self.__tables__ = TableRegistry(self.__keyspace_name__)
+        self.__write_concurrency__ = write_concurrency
+        self.__write_batch_size__ = write_batch_size
+        self.__read_concurrency__ = read_concurrency
+        self.__session_manager__ = session_manager
+        self.__latest_dp_cache__ = LatestPointCache(latest_dp_ttl_sek) if latest_dp_ttl_sek > 0 else None
+        self.__catalog__ = MetadataCatalog(metadata_refresh_sek)
+        self.__single_flight__ = SingleFlight()
+        self.__rollups_enabled__ = rollups_enabled
+        self.__rollup_scheduler__ = RollupScheduler(self._update_rollups_async, rollup_delay_sek, session_manager)
+        self.__hot_windows__ = HotWindowCache(hot_window_sek, hot_window_ttl_sek, hot_window_max_points, hot_window_reload_sek) if hot_window_sek > 0 else None
+        self.__typed_tables__ = typed_tables
+        self.__wide_values__ = wide_values
+        self.__data_ttl_sek__ = data_ttl_sek
+        self.__compaction_window_days__ = compaction_window_days
+
+    """
+    Returns the cached prepared statement for the query. The query is formatted with
+    the keyspace name, so {ks}.table is fully qualified and the driver can compute the
+    routing key of bound statements for token aware routing.
+    """
+    def _prepare(self, session:Session, cql:str, consistency_level) -> PreparedStatement:
+        return self.__statements__.get(session, cql.format(ks=self.__keyspace_name__), consistency_level)
+
+    """Async variant of _prepare, statements that are not cached yet are prepared off the event loop"""
+    async def _prepare_async(self, session:Session, cql:str, consistency_level) -> PreparedStatement:
+        return await self.__statements__.get_async(session, cql.format(ks=self.__keyspace_name__), consistency_level)
 
     def ensure_database_structure(self, session:Session):
         log.info("Ensuring database keyspaces and meta tables.")
@@ -64,10 +267,12 @@ class Database:
             name text,
             meta_info text,
             source_name text,
+            datatype text,
             PRIMARY KEY (name, source_name)
         )
         WITH CLUSTERING ORDER BY (source_name ASC)
         """ % SIGNAL_METADATA_TABLE)
+        self._ensure_columns(session, SIGNAL_METADATA_TABLE, {"datatype": "text"})
 
         session.execute(f"CREATE INDEX IF NOT EXISTS ON {SIGNAL_METADATA_TABLE} (source_name)")
         session.execute("""
@@ -77,125 +282,782 @@ class Database:
             value_int int,
             value_float float,
             value_text text,
+            value_bigint bigint,
+            value_double double,
             event_time timestamp,
             PRIMARY KEY (signal_name, source_name)
         )
         """ % SIGNAL_LAST_DP_TABLE)
+        self._ensure_columns(session, SIGNAL_LAST_DP_TABLE, {"value_bigint": "bigint", "value_double": "double"})
+        for level in ROLLUP_LEVELS:
+            session.execute(self._rollup_table_ddl(level))
+        self.load_tables(session)
+
+    """Loads the known tables of the keyspace, e.g. in worker processes that did not create the structure"""
+    def load_tables(self, session:Session):
+        self.__tables__.load(session)
     
-    def add_source(self, source:Source, session:Session):
+    """
+    Adds columns to tables that were created before the columns existed, e.g. the datatype of
+    meta_signals or the 64 bit value columns of latest_dp_signals
+    """
+    def _ensure_columns(self, session:Session, tablename:str, columns:dict[str, str]):
+        rows = session.execute("SELECT column_name FROM system_schema.columns WHERE keyspace_name = %s AND table_name = %s", (self.__keyspace_name__, tablename))
+        existing = {row.column_name for row in rows}
+        for column_name, column_type in columns.items():
+            if column_name not in existing:
+                log.info(f"Adding column {column_name} to {tablename}.")
+                session.execute(f"ALTER TABLE {self.__keyspace_name__}.{tablename} ADD {column_name} {column_type}")
+
+    async def add_source_async(self, source:Source, session:Session):
         log.info("Adding source %s to database." % source.unique_name)
-        query = SimpleStatement(f"INSERT INTO {SOURCE_METADATA_TABLE} (unique_name, meta_info, meta_zone) VALUES ( %s, %s, %s)", consistency_level=ConsistencyLevel.ONE)
-        session.set_keyspace(self.__keyspace_name__)
-        response = session.execute(query, (source.unique_name, source.meta_info, source.meta_zone))
-        response.all()
+        await execute_async(session, *await self._add_source_statement(source, session))
+        self.__catalog__.invalidate()
 
-    def add_signal(self, signal:Signal, session:Session):
+    async def _add_source_statement(self, source:Source, session:Session) -> tuple:
+        query = await self._prepare_async(session, f"INSERT INTO {{ks}}.{SOURCE_METADATA_TABLE} (unique_name, meta_info, meta_zone) VALUES (?, ?, ?)", ConsistencyLevel.ONE)
+        return query, (source.unique_name, source.meta_info, source.meta_zone)
+
+    async def add_signal_async(self, signal:Signal, session:Session):
         log.info("Adding signal %s to database." % signal.unique_name)
-        query = SimpleStatement(f"INSERT INTO {SIGNAL_METADATA_TABLE} (name, meta_info, source_name) VALUES ( %s, %s, %s)", consistency_level=ConsistencyLevel.ONE)
-        session.set_keyspace(self.__keyspace_name__)
-        response = session.execute(query, (signal.unique_name, signal.meta_info, signal.source_name))
-        response.all()
+        if signal.datatype is not None:
+            await self._ensure_signal_table_async(signal.source_name, signal.unique_name, signal.datatype, session)
+        await execute_async(session, *await self._add_signal_statement(signal, session))
+        self.__catalog__.invalidate()
 
-    def list_sources(self, session:Session) -> list:
-        query = SimpleStatement(f"SELECT * FROM {SOURCE_METADATA_TABLE}", consistency_level=ConsistencyLevel.QUORUM);
-        session.set_keyspace(self.__keyspace_name__)
-        response:ResultSet = session.execute(query)
-        rows = response.all()
-        sources = list()
-        for row_raw in rows:
-            row = row_raw._asdict()
-            sources.append(Source(unique_name=row["unique_name"], meta_info=row["meta_info"], meta_zone=row["meta_zone"]))
-        return sources
+    async def _add_signal_statement(self, signal:Signal, session:Session) -> tuple:
+        query = await self._prepare_async(session, f"INSERT INTO {{ks}}.{SIGNAL_METADATA_TABLE} (name, meta_info, source_name, datatype) VALUES (?, ?, ?, ?)", ConsistencyLevel.ONE)
+        # Without a datatype the column is left unset, so a datatype recorded before is kept
+        return query, (signal.unique_name, signal.meta_info, signal.source_name, signal.datatype.value if signal.datatype is not None else UNSET_VALUE)
+
+    """
+    Returns the cached snapshot of all sources and signals of the session's credentials, loading
+    it with one scan of each meta table when it was invalidated or is older than the refresh
+    interval. Signals are grouped by source in memory, so listings never need the secondary
+    index on meta_signals.
+    """
+    async def metadata_snapshot_async(self, session:Session) -> CatalogSnapshot:
+        scope = self._cache_scope(session)
+        snapshot = self.__catalog__.current(scope)
+        if snapshot is None:
+            generation = self.__catalog__.generation
+            # Concurrent requests of the same credentials for a stale catalog share one load
+            snapshot = await self.__single_flight__.run(("catalog", scope, generation), lambda: self._load_metadata_snapshot_async(scope, session, generation))
+        return snapshot
+
+    async def _load_metadata_snapshot_async(self, scope, session:Session, generation:int) -> CatalogSnapshot:
+        source_rows, signal_rows = await asyncio.gather(execute_async(session, await self._list_sources_query(session)), execute_async(session, await self._list_all_signals_query(session)))
+        snapshot = CatalogSnapshot(rows_to_sources(source_rows), rows_to_signals(signal_rows), generation)
+        self.__catalog__.store(scope, snapshot)
+        return snapshot
+
+    async def _list_sources_query(self, session:Session) -> PreparedStatement:
+        return await self._prepare_async(session, f"SELECT unique_name, meta_info, meta_zone FROM {{ks}}.{SOURCE_METADATA_TABLE}", ConsistencyLevel.QUORUM)
     
-    def list_signals(self, source_name, session:Session) -> list:
-        query = SimpleStatement(f"SELECT * FROM {SIGNAL_METADATA_TABLE} where source_name='{source_name}'", consistency_level=ConsistencyLevel.QUORUM);
-        session.set_keyspace(self.__keyspace_name__)
-        response:ResultSet = session.execute(query)
-        rows = response.all()
-        signals = list()
-        for row_raw in rows:
-            row = row_raw._asdict()
-            signals.append(Signal(unique_name=row['name'], meta_info=row['meta_info'], source_name=row['source_name'])) 
-        return signals
-    def write_timeseries(self, source_name:str, signal_name:str, timeseries:Timeseries, session:Session):
-        log.info(f"Writing timeseries {signal_name} from source {source_name} to database.")
-        tablename = f"{SIGNAL_INSTANCE_PREFIX}{source_name.lower().replace('_','')}_{signal_name.lower().replace('_','')}"
-        session.set_keyspace(self.__keyspace_name__)
-        session.execute("""
-        CREATE TABLE IF NOT EXISTS %s (
+    async def list_signals_async(self, source_name, session:Session) -> list:
+        return (await self.metadata_snapshot_async(session)).signals(source_name)
+
+    async def _list_all_signals_query(self, session:Session) -> PreparedStatement:
+        return await self._prepare_async(session, f"SELECT name, meta_info, source_name, datatype FROM {{ks}}.{SIGNAL_METADATA_TABLE}", ConsistencyLevel.QUORUM)
+
+    """
+    Creates the data table of a signal for the datatype unless it exists and returns the datatype
+    the table stores. The datatype of a typed table created here is also recorded in meta_signals,
+    so signals created by their first write are listed with it once they are added. If the signal
+    was not added yet this creates its meta_signals row with only a datatype, which listings skip
+    until /addSignal fills in the rest and keeps the datatype. Raises a DatatypeMismatchError if
+    the table is typed for another datatype.
+    """
+    async def _ensure_signal_table_async(self, source_name:str, signal_name:str, datatype:TSType, session:Session) -> TSType|None:
+        tablename = signal_table_name(source_name, signal_name)
+        created = await self.__tables__.ensure_async(tablename, self._signal_table_ddl(tablename, datatype), session, self._value_type(datatype))
+        if created and self.__typed_tables__:
+            try:
+                await execute_async(session, *await self._signal_datatype_statement(source_name, signal_name, datatype, session))
+                self.__catalog__.invalidate()
+            except Exception as exc:
+                log.warning(f"Datatype of {tablename} could not be recorded in {SIGNAL_METADATA_TABLE}: {exc}")
+        return self._checked_datatype(tablename, datatype, session)
+
+    async def _signal_datatype_statement(self, source_name:str, signal_name:str, datatype:TSType, session:Session) -> tuple:
+        query = await self._prepare_async(session, f"UPDATE {{ks}}.{SIGNAL_METADATA_TABLE} SET datatype = ? WHERE name = ? AND source_name = ?", ConsistencyLevel.ONE)
+        return query, (datatype.value, signal_name, source_name)
+
+    def _checked_datatype(self, tablename:str, datatype:TSType, session:Session) -> TSType|None:
+        stored_datatype = self._table_datatype(tablename, session)
+        if stored_datatype is not None and stored_datatype != datatype:
+            raise DatatypeMismatchError(f"The signal stores {stored_datatype.value} values, {datatype.value} points can not be written to it")
+        return stored_datatype
+
+    """Returns the datatype of a typed data table, None for legacy tables with value_int, value_float and value_text"""
+    def _table_datatype(self, tablename:str, session:Session) -> TSType|None:
+        value_type = self.__tables__.value_type(tablename, session)
+        return DATATYPES_BY_VALUE_TYPE.get(value_type) if value_type is not None else None
+
+    def stored_datatype(self, source_name:str, signal_name:str, session:Session) -> TSType|None:
+        return self._table_datatype(signal_table_name(source_name, signal_name), session)
+
+    """Raises a DatatypeMismatchError if the signal has a typed data table of another datatype, for writes that are not written right away"""
+    def check_datatype(self, source_name:str, signal_name:str, datatype:TSType, session:Session):
+        self._checked_datatype(signal_table_name(source_name, signal_name), datatype, session)
+
+    """
+    Returns the points of the timeseries whose values can not be stored in the data table of
+    the signal, or in the table its first write creates. For writes that are acknowledged
+    before they are written.
+    """
+    def invalid_points(self, source_name:str, signal_name:str, timeseries:Timeseries, session:Session) -> list[PointFailure]:
+        tablename = signal_table_name(source_name, signal_name)
+        if self.__tables__.exists(tablename, session):
+            value_type = self.__tables__.value_type(tablename, session)
+        else:
+            value_type = self._value_type(timeseries.datatype)
+        if value_type is None:
+            # Legacy tables store every datatype in its own column of the default type
+            value_type = VALUE_TYPES[timeseries.datatype][0]
+        failures = list()
+        for index, t_point in enumerate(timeseries.tsPoints):
+            error = value_error(t_point.value, value_type)
+            if error is not None:
+                failures.append(PointFailure(index=index, timestamp=t_point.timestamp, error=error))
+        return failures
+
+    """Returns the CQL type of the value column new tables of the datatype get, None if new tables use the legacy columns"""
+    def _value_type(self, datatype:TSType) -> str|None:
+        if not self.__typed_tables__:
+            return None
+        return VALUE_TYPES[datatype][1 if self.__wide_values__ else 0]
+
+    def _signal_table_ddl(self, tablename:str, datatype:TSType) -> str:
+        value_type = self._value_type(datatype)
+        value_columns = f"value {value_type}," if value_type is not None else "value_int int, value_float float, value_text text,"
+        return """
+        CREATE TABLE IF NOT EXISTS %s.%s (
             event_time timestamp,
-            date date, 
-            value_int int,
-            value_float float,
-            value_text text,
+            date date,
+            %s
             PRIMARY KEY (date, event_time)
-        ) WITH CLUSTERING ORDER BY (event_time DESC);
-        """ % tablename)
-        query = SimpleStatement(f"INSERT INTO {tablename} (event_time, date, value_int, value_float, value_text) VALUES ( %s, %s, %s, %s, %s)", consistency_level=ConsistencyLevel.ONE)
-        query_faceplate = SimpleStatement(f"INSERT INTO {SIGNAL_LAST_DP_TABLE} (signal_name, source_name, event_time, value_int, value_float, value_text) VALUES ( %s, %s, %s, %s, %s, %s)", consistency_level=ConsistencyLevel.ONE)
-        for t_point in timeseries.tsPoints:
+        ) WITH CLUSTERING ORDER BY (event_time DESC)
+        AND %s;
+        """ % (self.__keyspace_name__, tablename, value_columns, self.data_table_options())
+
+    """
+    Returns the table options of data tables: points are written in time order and rarely
+    rewritten, so time window compaction keeps the SSTables of a window together and drops
+    whole SSTables once all their points expired after the default TTL (0 keeps points forever).
+    """
+    def data_table_options(self) -> str:
+        compaction = f"{{'class': 'TimeWindowCompactionStrategy', 'compaction_window_unit': 'DAYS', 'compaction_window_size': {self.__compaction_window_days__}}}"
+        return f"compaction = {compaction} AND default_time_to_live = {self.__data_ttl_sek__}"
+
+    """
+    Groups the points by their date partition into unlogged batches of at most
+    write_batch_size rows. Returns the batches with the indices of their points and
+    the failures of points whose value does not fit the value column of the table.
+    """
+    async def _build_write_batches(self, tablename:str, timeseries:Timeseries, stored_datatype:TSType|None, session:Session) -> tuple:
+        if stored_datatype is None:
+            query = await self._prepare_async(session, f"INSERT INTO {{ks}}.{tablename} (event_time, date, value_int, value_float, value_text) VALUES (?, ?, ?, ?, ?)", ConsistencyLevel.ONE)
+            row_values = lambda value: typed_values(timeseries.datatype, value)
+        else:
+            query = await self._prepare_async(session, f"INSERT INTO {{ks}}.{tablename} (event_time, date, value) VALUES (?, ?, ?)", ConsistencyLevel.ONE)
+            row_values = lambda value: (value,)
+        partitions:dict[date, list] = dict()
+        for index, t_point in enumerate(timeseries.tsPoints):
             event_date = t_point.timestamp.astimezone(pytz.utc).date()
-            v_int = None
-            v_float = None
-            v_text = None
-            if(timeseries.datatype == TSType.INT):
-                v_int = t_point.value
-            elif(timeseries.datatype == TSType.FLOAT):
-                v_float = t_point.value
-            else:
-                v_text = t_point.value
+            partitions.setdefault(event_date, list()).append(index)
+        batches = list()
+        failures = list()
+        for event_date, indices in partitions.items():
+            for chunk_start in range(0, len(indices), self.__write_batch_size__):
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED, consistency_level=ConsistencyLevel.ONE)
+                chunk = list()
+                for index in indices[chunk_start:chunk_start + self.__write_batch_size__]:
+                    t_point = timeseries.tsPoints[index]
+                    # The driver raises while binding values that do not fit the column, e.g. 1.5 for an int
+                    # or a number for a text column, which is not wrapped into a TypeError by the driver
+                    try:
+                        batch.add(query, (t_point.timestamp, event_date) + row_values(t_point.value))
+                    except (TypeError, ValueError, AttributeError, OverflowError) as exc:
+                        failures.append(PointFailure(index=index, timestamp=t_point.timestamp, error=str(exc)))
+                        continue
+                    chunk.append(index)
+                if chunk:
+                    batches.append((batch, chunk))
+        return batches, failures
+
+    """
+    Returns the failed points and the index of the newest written point (None if nothing was
+    written) of executed write batches, after the points that could not be bound
+    """
+    def _collect_write_results(self, tablename:str, timeseries:Timeseries, batches:list, results:list, bind_failures:list) -> tuple:
+        failures = list(bind_failures)
+        newest_index = None
+        for (_, indices), (success, result) in zip(batches, results):
+            for index in indices:
+                t_point = timeseries.tsPoints[index]
+                if not success:
+                    failures.append(PointFailure(index=index, timestamp=t_point.timestamp, error=str(result)))
+                elif newest_index is None or t_point.timestamp > timeseries.tsPoints[newest_index].timestamp:
+                    newest_index = index
+        if failures:
+            failures.sort(key=lambda failure: failure.index)
+            log.warning(f"{len(failures)} of {len(timeseries.tsPoints)} points of {tablename} could not be written.")
+        return failures, newest_index
+
+    """
+    Returns the statement and parameters that store the point as latest datapoint of the signal.
+    The 32 bit value columns are cleared, they only hold latest datapoints of older versions.
+    """
+    async def _latest_dp_statement(self, source_name:str, signal_name:str, datatype:TSType, t_point:TSPoint, session:Session) -> tuple:
+        query_faceplate = await self._prepare_async(session, f"INSERT INTO {{ks}}.{SIGNAL_LAST_DP_TABLE} (signal_name, source_name, event_time, value_int, value_float, value_text, value_bigint, value_double) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ConsistencyLevel.ONE)
+        return query_faceplate, (clean_name(signal_name), clean_name(source_name), t_point.timestamp, None, None) + latest_values(datatype, t_point.value)
+
+    """
+    Writes all points of the timeseries with concurrent unlogged batches (one partition per
+    batch) and afterwards stores the newest written point as latest datapoint of the signal.
+    Points of failed batches are reported in the returned WriteResult, as is the newest point
+    if it was written but could not be stored as latest datapoint. The rollups of the written
+    points are recomputed in the background, see RollupScheduler.
+    """
+    async def write_timeseries_async(self, source_name:str, signal_name:str, timeseries:Timeseries, session:Session) -> WriteResult:
+        log.info(f"Writing timeseries {signal_name} from source {source_name} to database.")
+        tablename = signal_table_name(source_name, signal_name)
+        stored_datatype = await self._ensure_signal_table_async(source_name, signal_name, timeseries.datatype, session)
+        batches, bind_failures = await self._build_write_batches(tablename, timeseries, stored_datatype, session)
+        with stage("write_timeseries", "query"):
+            results = await execute_concurrent_async(session, [(batch, ()) for batch, _ in batches], concurrency=self.__write_concurrency__)
+        failures, newest_index = self._collect_write_results(tablename, timeseries, batches, results, bind_failures)
+        points_written = len(timeseries.tsPoints) - len(failures)
+        count_points(timeseries.datatype.value, points_written, len(failures))
+        if self._maintains_rollups(timeseries) and points_written > 0:
+            self.__rollup_scheduler__.schedule(tablename, source_name, signal_name, written_timestamps(timeseries, failures), session)
+        self._cache_written_points(tablename, timeseries, stored_datatype, failures)
+        if newest_index is not None:
+            newest_point = timeseries.tsPoints[newest_index]
             try:
-                clean_source_name = f"{source_name.lower().replace('_','')}"
-                clean_signal_name = f"{signal_name.lower().replace('_','')}"
-                response_faceplate:ResultSet = session.execute(query_faceplate, (clean_signal_name, clean_source_name, t_point.timestamp, v_int, v_float, v_text))
-                response:ResultSet = session.execute(query, (t_point.timestamp, event_date, v_int, v_float, v_text))
-            except:
-                return False
-        return True
-    def read_timeseries(self, source_name:str, signal_name:str, start_time: datetime, end_time: datetime, session:Session) -> Timeseries:
-        session.set_keyspace(self.__keyspace_name__)
-        tablename = f"{SIGNAL_INSTANCE_PREFIX}{source_name.lower().replace('_','')}_{signal_name.lower().replace('_','')}"
-        if(start_time.date()!=end_time.date()):
-            #NotSupportedYet
-            query = SimpleStatement(f"SELECT * FROM {tablename} where date='{start_time.date()}'", consistency_level=ConsistencyLevel.QUORUM);
+                await execute_async(session, *await self._latest_dp_statement(source_name, signal_name, timeseries.datatype, newest_point, session))
+            except Exception as exc:
+                log.warning(f"Latest datapoint of {tablename} could not be written: {exc}")
+                # The point is in the data table, but reads of the latest datapoint do not see it
+                failures = sorted(failures + [PointFailure(index=newest_index, timestamp=newest_point.timestamp, error=f"Latest datapoint could not be written: {exc}")], key=lambda failure: failure.index)
+                return WriteResult(applied=False, points_written=points_written, failures=failures)
+            self._cache_written_point(source_name, signal_name, newest_point, session)
+        return WriteResult(applied=not failures, points_written=points_written, failures=failures)
+
+    """Recomputes the rollups still pending from recent writes, used on shutdown"""
+    async def drain_rollups(self):
+        await self.__rollup_scheduler__.drain()
+
+    def _maintains_rollups(self, timeseries:Timeseries) -> bool:
+        return self.__rollups_enabled__ and timeseries.datatype != TSType.STRING and len(timeseries.tsPoints) > 0
+
+    def _rollup_table_ddl(self, level:RollupLevel) -> str:
+        return """
+        CREATE TABLE IF NOT EXISTS %s.%s (
+            source_name text,
+            signal_name text,
+            period date,
+            bucket_start timestamp,
+            value_min double,
+            value_max double,
+            value_sum double,
+            value_count bigint,
+            value_first double,
+            value_last double,
+            PRIMARY KEY ((source_name, signal_name, period), bucket_start)
+        ) WITH CLUSTERING ORDER BY (bucket_start ASC);
+        """ % (self.__keyspace_name__, level.table)
+
+    async def _rollup_range_query(self, level:RollupLevel, session:Session) -> PreparedStatement:
+        return await self._prepare_async(session, f"SELECT bucket_start, value_min, value_max, value_sum, value_count, value_first, value_last FROM {{ks}}.{level.table} WHERE source_name = ? AND signal_name = ? AND period = ? AND bucket_start >= ? AND bucket_start <= ?", ConsistencyLevel.ONE)
+
+    """
+    Returns the statements that read what the buckets of ROLLUP_LEVELS[level_index] are computed
+    from: the raw rows for the finest level, the buckets of the next finer level otherwise.
+    """
+    async def _rollup_source_statements(self, level_index:int, source_name:str, signal_name:str, bucket_starts:np.ndarray, session:Session) -> list:
+        level = ROLLUP_LEVELS[level_index]
+        if level_index == 0:
+            query = await self._range_query(source_name, signal_name, session, order="ASC")
+            return [(query, (period, as_datetime(first_ms), as_datetime(last_ms))) for period, first_ms, last_ms in source_ranges(bucket_starts, level.bucket_ms, ROLLUP_LEVELS[0].period_of)]
+        finer = ROLLUP_LEVELS[level_index - 1]
+        query = await self._rollup_range_query(finer, session)
+        return [(query, (clean_name(source_name), clean_name(signal_name), period, as_datetime(first_ms), as_datetime(last_ms))) for period, first_ms, last_ms in source_ranges(bucket_starts, level.bucket_ms, finer.period_of)]
+
+    """Recomputes the given buckets of a level from the results of its source statements, returns them with their insert statements"""
+    async def _recompute_rollups(self, level_index:int, source_name:str, signal_name:str, bucket_starts:np.ndarray, results:list, session:Session) -> tuple:
+        level = ROLLUP_LEVELS[level_index]
+        rows = list()
+        for success, result in results:
+            if not success:
+                raise result
+            rows.extend(result)
+        parts = Rollups.from_data_rows(rows, datatype_name(self.stored_datatype(source_name, signal_name, session))) if level_index == 0 else Rollups.from_rollup_rows(rows)
+        rollups = parts.combine(level.bucket_ms).select(bucket_starts)
+        query = await self._prepare_async(session, f"INSERT INTO {{ks}}.{level.table} (source_name, signal_name, period, bucket_start, value_min, value_max, value_sum, value_count, value_first, value_last) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", ConsistencyLevel.ONE)
+        source, signal = clean_name(source_name), clean_name(signal_name)
+        inserts = [
+            (query, (source, signal, level.period_of(bucket_start), as_datetime(bucket_start), value_min, value_max, value_sum, value_count, value_first, value_last))
+            for bucket_start, value_min, value_max, value_sum, value_count, value_first, value_last
+            in zip(rollups.timestamps.tolist(), rollups.min.tolist(), rollups.max.tolist(), rollups.sum.tolist(), rollups.count.tolist(), rollups.first.tolist(), rollups.last.tolist())
+        ]
+        return rollups, inserts
+
+    """
+    Recomputes every rollup bucket that contains one of the timestamps, level by level: the
+    minutes from the raw rows, the hours from the minutes and the days from the hours. Buckets
+    are recomputed instead of incremented, so rewritten points are not counted twice.
+    """
+    async def _update_rollups_async(self, source_name:str, signal_name:str, timestamps_ms:np.ndarray, session:Session):
+        changed = timestamps_ms
+        for level_index, level in enumerate(ROLLUP_LEVELS):
+            bucket_starts = affected_buckets(changed, level.bucket_ms)
+            statements = await self._rollup_source_statements(level_index, source_name, signal_name, bucket_starts, session)
+            results = await execute_concurrent_async(session, statements, concurrency=self.__read_concurrency__)
+            rollups, inserts = await self._recompute_rollups(level_index, source_name, signal_name, bucket_starts, results, session)
+            for success, result in await execute_concurrent_async(session, inserts, concurrency=self.__write_concurrency__):
+                if not success:
+                    raise result
+            if len(rollups) == 0:
+                return
+            changed = rollups.timestamps
+
+    """Returns the (source_name, signal_name) of every data table of the keyspace"""
+    def data_signals(self, session:Session) -> list:
+        rows = session.execute("SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s", (self.__keyspace_name__,))
+        return [tuple(row.table_name[len(SIGNAL_INSTANCE_PREFIX):].split("_", 1)) for row in rows if row.table_name.startswith(SIGNAL_INSTANCE_PREFIX)]
+
+    """Computes the rollups of all data a signal already holds, day by day"""
+    async def backfill_rollups_async(self, source_name:str, signal_name:str, session:Session) -> int:
+        tablename = signal_table_name(source_name, signal_name)
+        days = sorted(row.date.date() for row in await execute_async(session, f"SELECT DISTINCT date FROM {self.__keyspace_name__}.{tablename}"))
+        for day in days:
+            day_start = ms_of(day)
+            await self._update_rollups_async(source_name, signal_name, np.arange(day_start, day_start + 86400000, ROLLUP_LEVELS[0].bucket_ms, dtype=np.int64), session)
+        return len(days)
+
+    """Returns the datatype of the first value of a legacy data table, None if it is empty"""
+    def sample_datatype(self, source_name:str, signal_name:str, session:Session) -> TSType|None:
+        tablename = signal_table_name(source_name, signal_name)
+        row = session.execute(f"SELECT value_int, value_float, value_text FROM {self.__keyspace_name__}.{tablename} LIMIT 1").one()
+        if row is None:
+            return None
+        return next((datatype for datatype, column in LEGACY_VALUE_COLUMNS.items() if getattr(row, column) is not None), None)
+
+    """
+    Converts the legacy data table of a signal into a typed table in place: the value column
+    is added, every point is copied into it, the legacy columns are dropped and the table gets
+    the data table options. Returns the number of copied points. Raises a DatatypeMismatchError
+    if a point is not of the datatype, the table then keeps its legacy layout and the migration
+    can be rerun. Processes that use the table have to be restarted afterwards.
+    """
+    def migrate_to_typed(self, source_name:str, signal_name:str, datatype:TSType, session:Session) -> int:
+        tablename = signal_table_name(source_name, signal_name)
+        table = f"{self.__keyspace_name__}.{tablename}"
+        value_type = VALUE_TYPES[datatype][1 if self.__wide_values__ else 0]
+        columns = {row.column_name: row.type for row in session.execute("SELECT column_name, type FROM system_schema.columns WHERE keyspace_name = %s AND table_name = %s", (self.__keyspace_name__, tablename))}
+        if "value_int" not in columns:
+            return 0
+        if "value" not in columns:
+            session.execute(f"ALTER TABLE {table} ADD value {value_type}")
+        elif columns["value"] != value_type:
+            raise DatatypeMismatchError(f"{tablename} already has a value column of type {columns['value']}, {value_type} was asked for")
+        legacy_column = LEGACY_VALUE_COLUMNS[datatype]
+        copy = self._prepare(session, f"UPDATE {{ks}}.{tablename} SET value = ? WHERE date = ? AND event_time = ?", ConsistencyLevel.QUORUM)
+        copied = 0
+        statements = list()
+        for row in session.execute(SimpleStatement(f"SELECT date, event_time, value_int, value_float, value_text FROM {table}", fetch_size=MIGRATION_CHUNK_ROWS)):
+            value = getattr(row, legacy_column)
+            if value is None or any(getattr(row, column) is not None for column in LEGACY_VALUE_COLUMNS.values() if column != legacy_column):
+                raise DatatypeMismatchError(f"{tablename} holds a point at {row.event_time} that is not of type {datatype.value}")
+            statements.append((copy, (value, row.date, row.event_time)))
+            if len(statements) >= MIGRATION_CHUNK_ROWS:
+                execute_concurrent(session, statements, concurrency=self.__write_concurrency__, raise_on_first_error=True)
+                copied += len(statements)
+                statements = list()
+        execute_concurrent(session, statements, concurrency=self.__write_concurrency__, raise_on_first_error=True)
+        copied += len(statements)
+        session.execute(f"ALTER TABLE {table} DROP (value_int, value_float, value_text)")
+        session.execute(f"ALTER TABLE {table} WITH {self.data_table_options()}")
+        self.__tables__.add(tablename, value_type)
+        return copied
+
+    """Returns the UTC dates of all partitions that hold data between start_time and end_time, newest first"""
+    def _partition_dates(self, start_time:datetime, end_time:datetime) -> list:
+        first_date = as_utc(start_time).date()
+        last_date = as_utc(end_time).date()
+        return [last_date - timedelta(days=offset) for offset in range((last_date - first_date).days + 1)]
+
+    """Returns the range query of a data table, rows of typed tables have the columns event_time and value"""
+    async def _range_query(self, source_name:str, signal_name:str, session:Session, order:str = "DESC") -> PreparedStatement:
+        tablename = signal_table_name(source_name, signal_name)
+        value_columns = "value" if self._table_datatype(tablename, session) is not None else "value_int, value_float, value_text"
+        return await self._prepare_async(session, f"SELECT event_time, {value_columns} FROM {{ks}}.{tablename} WHERE date = ? AND event_time >= ? AND event_time <= ? ORDER BY event_time {order}", ConsistencyLevel.QUORUM)
+
+    """
+    Reads the rows of a signal between start_time and end_time. All date partitions of the
+    window are queried with execute_async, at most read_concurrency at once. Once all of them
+    have loaded, their rows are concatenated in time order (newest first), as the partitions
+    are queried newest date first and every partition is sorted by the clustering order.
+    """
+    async def _fetch_rows_async(self, source_name:str, signal_name:str, start_time:datetime, end_time:datetime, session:Session, semaphore:asyncio.Semaphore|None = None) -> list:
+        if self.__hot_windows__ is not None:
+            rows = await self._hot_rows_async(source_name, signal_name, start_time, end_time, session, semaphore)
+            if rows is not None:
+                return rows
+        return await self._query_rows_async(source_name, signal_name, start_time, end_time, session, semaphore)
+
+    """
+    Answers reads within the hot window from memory. A missing window is loaded and a stale
+    one is synced with a tail fetch first, viewers of the same signal share that query.
+    Returns None for reads that reach further back than the hot window.
+    """
+    async def _hot_rows_async(self, source_name:str, signal_name:str, start_time:datetime, end_time:datetime, session:Session, semaphore:asyncio.Semaphore|None = None) -> list|None:
+        hot_windows = self.__hot_windows__
+        start_time, end_time = utc_naive(start_time), utc_naive(end_time)
+        if not hot_windows.covers(start_time):
+            return None
+        key = (self._cache_scope(session), signal_table_name(source_name, signal_name))
+        fresh, synced_to = hot_windows.state(key)
+        if not fresh:
+            await self.__single_flight__.run(("hot", key), lambda: self._sync_hot_window_async(source_name, signal_name, key, synced_to, session, semaphore))
+        return hot_windows.rows(key, start_time, end_time)
+
+    async def _sync_hot_window_async(self, source_name:str, signal_name:str, key:tuple, synced_to:datetime|None, session:Session, semaphore:asyncio.Semaphore|None):
+        hot_windows = self.__hot_windows__
+        now = utc_now()
+        if synced_to is None:
+            covered_from = hot_windows.window_start()
+            rows = await self._query_rows_async(source_name, signal_name, covered_from, now + TAIL_OVERLAP, session, semaphore)
+            hot_windows.load(key, rows, covered_from, now)
         else:
-            query = SimpleStatement(f"SELECT * FROM {tablename} where date='{start_time.date()}' and event_time >= '{start_time}+0000' and event_time <= '{end_time}+0000' order by event_time desc", consistency_level=ConsistencyLevel.QUORUM);
-            response:ResultSet = session.execute(query)
-            rows = response.all()
-            ts_points_int = list()
-            ts_points_float = list()
-            ts_points_text = list()
-            for row_raw in rows:
-                row = row_raw._asdict()
-                if(row['value_int'] is not None):
-                    t_point = TSPoint(timestamp=row['event_time'], value=row['value_int'])
-                    ts_points_int.append(t_point)
-                elif(row['value_float'] is not None):
-                    t_point = TSPoint(timestamp=row['event_time'], value=row['value_float'])
-                    ts_points_float.append(t_point)
-                elif(row['value_text'] is not None):
-                    t_point = TSPoint(timestamp=row['event_time'], value=row['value_text'])
-                    ts_points_text.append(t_point)
-            ts_int = Timeseries(datatype=TSType.INT, tsPoints=ts_points_int)
-            ts_float = Timeseries(datatype=TSType.FLOAT, tsPoints=ts_points_float)
-            ts_string = Timeseries(datatype=TSType.STRING, tsPoints=ts_points_text)
-            return ts_int, ts_float, ts_string
-    def read_latest_dp(self, source_name:str, signal_name:str, session:Session) -> TSPoint:
-        session.set_keyspace(self.__keyspace_name__)
-        clean_source_name = f"{source_name.lower().replace('_','')}"
-        clean_signal_name = f"{signal_name.lower().replace('_','')}"
-        query = SimpleStatement(f"SELECT * FROM {SIGNAL_LAST_DP_TABLE} where source_name='{clean_source_name}' and signal_name='{clean_signal_name}' LIMIT 1", consistency_level=ConsistencyLevel.QUORUM);
-        response:ResultSet = session.execute(query)
-        row_raw = response.one()
-        if not row_raw == None :
-            row = row_raw._asdict()
-            if(row['value_int'] is not None):
-                return TSPoint(timestamp=row['event_time'], value=row['value_int'])
-            elif(row['value_float'] is not None):
-                return TSPoint(timestamp=row['event_time'], value=row['value_float'])
-            elif(row['value_text'] is not None):
-                return TSPoint(timestamp=row['event_time'], value=row['value_text'])
+            rows = await self._query_rows_async(source_name, signal_name, synced_to - TAIL_OVERLAP, now + TAIL_OVERLAP, session, semaphore)
+            hot_windows.extend(key, rows, now)
+
+    async def _query_rows_async(self, source_name:str, signal_name:str, start_time:datetime, end_time:datetime, session:Session, semaphore:asyncio.Semaphore|None = None) -> list:
+        query = await self._range_query(source_name, signal_name, session)
+        results = await execute_concurrent_async(session, [(query, (partition_date, start_time, end_time)) for partition_date in self._partition_dates(start_time, end_time)], concurrency=self.__read_concurrency__, semaphore=semaphore)
+        rows = list()
+        for success, result in results:
+            if not success:
+                raise result
+            rows.extend(result)
+        return rows
+
+    """
+    Fetches the rows of a read, timed as query stage of the operation. Returns the datatype
+    of the data table (None for legacy tables) and the rows.
+    """
+    async def _read_rows_async(self, operation:str, source_name:str, signal_name:str, start_time:datetime, end_time:datetime, session:Session) -> tuple:
+        datatype = self.stored_datatype(source_name, signal_name, session)
+        with stage(operation, "query"):
+            rows = await self._fetch_rows_async(source_name, signal_name, start_time, end_time, session)
+        observe_rows(operation, len(rows))
+        return datatype, rows
+
+    """
+    Runs CPU heavy row decoding of large results in a worker thread, so the event loop keeps
+    serving requests. Timed as decode stage of the operation.
+    """
+    async def _decode_async(self, operation:str, decoder, rows:list, *args, row_count:int|None = None):
+        with stage(operation, "decode"):
+            if (len(rows) if row_count is None else row_count) > DECODE_OFFLOAD_ROWS:
+                return await asyncio.to_thread(decoder, rows, *args)
+            return decoder(rows, *args)
+
+    """
+    Returns an async iterator over the rows of a signal between start_time and end_time page
+    by page in ascending time order. Every date partition is paged through with the given
+    fetch_size, so only one page is held in memory at a time. The statement is prepared and
+    the first page fetched before returning, so failing reads raise before a response is started.
+    """
+    async def open_timeseries_pages_async(self, source_name:str, signal_name:str, start_time:datetime, end_time:datetime, session:Session, fetch_size:int = 5000):
+        query = await self._range_query(source_name, signal_name, session, order="ASC")
+        statements = list()
+        for partition_date in reversed(self._partition_dates(start_time, end_time)):
+            statement = query.bind((partition_date, start_time, end_time))
+            statement.fetch_size = fetch_size
+            statements.append(statement)
+        pages = self._timeseries_pages(statements, session)
+        first_page = await anext(pages, None)
+        return self._prepend_page(first_page, pages)
+
+    async def _timeseries_pages(self, statements:list, session:Session):
+        for statement in statements:
+            async for rows in iter_pages(session.execute_async(statement)):
+                if rows:
+                    yield rows
+
+    async def _prepend_page(self, first_page:list|None, pages):
+        if first_page is None:
+            return
+        yield first_page
+        async for rows in pages:
+            yield rows
+
+    async def read_timeseries_async(self, source_name:str, signal_name:str, start_time: datetime, end_time: datetime, session:Session) -> Timeseries:
+        datatype, rows = await self._read_rows_async("read_timeseries", source_name, signal_name, start_time, end_time, session)
+        return await self._decode_async("read_timeseries", rows_to_timeseries, rows, datatype)
+
+    """Reads a signal as column arrays in ascending time order, without building a TSPoint per row"""
+    async def read_timeseries_columnar_async(self, source_name:str, signal_name:str, start_time:datetime, end_time:datetime, session:Session) -> ColumnarTimeseries:
+        datatype, rows = await self._read_rows_async("read_timeseries_columnar", source_name, signal_name, start_time, end_time, session)
+        return await self._decode_async("read_timeseries_columnar", rows_to_columnar, rows, datatype_name(datatype))
+
+    """
+    Reads a numeric signal reduced for visualisation: either min/max/mean/count/first/last per
+    bucket of bucket_ms, or LTTB downsampled to the given number of points. If only one of
+    bucket_ms and points is given, the other one is derived from the length of the window.
+    Bucket aggregations of INT and FLOAT tables answered from the rollups are snapped to their
+    buckets, see plan_rollup_read, the returned bucket_ms is the one actually used. Buckets
+    whose rollups are still being recomputed after writes through this process are
+    aggregated from raw rows. Raises an UnsupportedDatatypeError for STRING signals.
+    """
+    async def read_timeseries_aggregated_async(self, source_name:str, signal_name:str, start_time:datetime, end_time:datetime, session:Session, mode:AggregationMode = AggregationMode.BUCKETS, bucket_ms:int|None = None, points:int|None = None) -> AggregatedTimeseries|DownsampledTimeseries:
+        stored_datatype = self.stored_datatype(source_name, signal_name, session)
+        if stored_datatype == TSType.STRING:
+            raise UnsupportedDatatypeError("Only INT and FLOAT signals can be aggregated")
+        # Legacy tables may hold any datatype, they are always aggregated from raw rows
+        if mode == AggregationMode.BUCKETS and self.__rollups_enabled__ and stored_datatype in (TSType.INT, TSType.FLOAT):
+            start_ms, end_ms, bucket_ms, points = resolve_buckets(start_time, end_time, bucket_ms, points)
+            pending_from = self.__rollup_scheduler__.pending_from(signal_table_name(source_name, signal_name))
+            planned = plan_rollup_read(start_ms, end_ms, bucket_ms, pending_from - 1 if pending_from is not None else None)
+            if planned is not None:
+                plan, start_ms, bucket_ms = planned
+                with stage("read_timeseries_aggregated", "rollups"):
+                    return await self._read_rollups_async(source_name, signal_name, plan, start_ms, bucket_ms, session)
+        datatype, rows = await self._read_rows_async("read_timeseries_aggregated", source_name, signal_name, start_time, end_time, session)
+        return await self._decode_async("read_timeseries_aggregated", aggregate_rows, rows, start_time, end_time, mode, bucket_ms, points, datatype_name(datatype))
+
+    """Returns the statements reading the rollup segments of a plan_rollup_read plan and the raw segment, if there is one"""
+    async def _rollup_read_statements(self, source_name:str, signal_name:str, plan:list, session:Session) -> tuple:
+        statements = list()
+        raw_segment = None
+        source, signal = clean_name(source_name), clean_name(signal_name)
+        for level, first_ms, last_ms in plan:
+            if level is None:
+                raw_segment = (as_datetime(first_ms), as_datetime(last_ms))
+                continue
+            query = await self._rollup_range_query(level, session)
+            statements.extend((query, (source, signal, period, as_datetime(first_ms), as_datetime(last_ms))) for period in level.periods(first_ms, last_ms))
+        return statements, raw_segment
+
+    """
+    Answers a bucket aggregation from the rollup tables, the part of the window that is not
+    covered by whole rollup buckets is aggregated from raw rows.
+    """
+    async def _read_rollups_async(self, source_name:str, signal_name:str, plan:list, start_ms:int, bucket_ms:int, session:Session) -> AggregatedTimeseries:
+        statements, raw_segment = await self._rollup_read_statements(source_name, signal_name, plan, session)
+        reads = [execute_concurrent_async(session, statements, concurrency=self.__read_concurrency__)]
+        if raw_segment is not None:
+            reads.append(self._fetch_rows_async(source_name, signal_name, *raw_segment, session))
+        results, *raw_rows = await asyncio.gather(*reads)
+        parts = list()
+        for success, result in results:
+            if not success:
+                raise result
+            parts.append(Rollups.from_rollup_rows(result))
+        if raw_rows:
+            parts.append(Rollups.from_points(*rows_to_arrays(raw_rows[0], datatype_name(self.stored_datatype(source_name, signal_name, session)))))
+        return Rollups.concat(parts).combine(bucket_ms, start_ms).to_aggregated(bucket_ms)
+
+    """
+    Reads the rows of many signals, the signals are queried concurrently but share one limit of
+    read_concurrency partition queries in flight. Returns the datatype of the data table (None
+    for legacy tables) and the newest first rows of every signal.
+    """
+    async def _fetch_multi_rows_async(self, signals:list[SignalRef], start_time:datetime, end_time:datetime, session:Session) -> tuple:
+        # Fails on invalid names before any query is sent
+        datatypes = [self.stored_datatype(signal.source_name, signal.signal_name, session) for signal in signals]
+        semaphore = asyncio.Semaphore(self.__read_concurrency__)
+        return datatypes, await asyncio.gather(*(self._fetch_rows_async(signal.source_name, signal.signal_name, start_time, end_time, session, semaphore) for signal in signals))
+
+    """Reads many signals as column arrays in ascending time order, one ColumnarTimeseries per signal"""
+    async def read_timeseries_multi_columnar_async(self, signals:list[SignalRef], start_time:datetime, end_time:datetime, session:Session) -> list[ColumnarTimeseries]:
+        with stage("read_timeseries_multi", "query"):
+            datatypes, rows_per_signal = await self._fetch_multi_rows_async(signals, start_time, end_time, session)
+        row_count = sum(map(len, rows_per_signal))
+        observe_rows("read_timeseries_multi", row_count)
+        return await self._decode_async("read_timeseries_multi", rows_to_multi_columnar, rows_per_signal, datatypes, row_count=row_count)
+
+    """
+    Reads many numeric signals and puts them on the grid of bucket_ms wide slots from start_time
+    to end_time, either with the last value at or before every slot (ffill) or with the mean
+    of every bucket (bucket).
+    """
+    async def read_timeseries_aligned_async(self, signals:list[SignalRef], start_time:datetime, end_time:datetime, session:Session, alignment:Alignment, bucket_ms:int) -> AlignedColumns:
+        with stage("read_timeseries_aligned", "query"):
+            datatypes, rows_per_signal = await self._fetch_multi_rows_async(signals, start_time, end_time, session)
+        row_count = sum(map(len, rows_per_signal))
+        observe_rows("read_timeseries_aligned", row_count)
+        return await self._decode_async("read_timeseries_aligned", align_rows, rows_per_signal, datatypes, signals, start_time, end_time, alignment, bucket_ms, row_count=row_count)
+
+    def _cache_written_points(self, tablename:str, timeseries:Timeseries, stored_datatype:TSType|None, failures:list[PointFailure]):
+        if self.__hot_windows__ is not None:
+            failed = {failure.index for failure in failures}
+            # Cached rows have the columns the range query of the table returns
+            if stored_datatype is None:
+                rows = [HotRow(utc_naive(t_point.timestamp), *typed_values(timeseries.datatype, t_point.value)) for index, t_point in enumerate(timeseries.tsPoints) if index not in failed]
+            else:
+                rows = [TypedHotRow(utc_naive(t_point.timestamp), t_point.value) for index, t_point in enumerate(timeseries.tsPoints) if index not in failed]
+            self.__hot_windows__.add_written(tablename, rows)
+
+    def _cache_written_point(self, source_name:str, signal_name:str, t_point:TSPoint, session:Session):
+        if self.__latest_dp_cache__ is not None:
+            self.__latest_dp_cache__.put_written(self._cache_scope(session), clean_name(source_name), clean_name(signal_name), t_point)
+
+    """
+    Returns the scope of the caches for the session: the credential key it was connected with,
+    so cached data is only served to the credentials it was read or written with. Sessions
+    that are not pooled by the session manager, e.g. of the command line tools, share None.
+    """
+    def _cache_scope(self, session:Session) -> tuple|None:
+        if self.__session_manager__ is None:
+            return None
+        return self.__session_manager__.credential_key_of(session)
+
+    async def read_latest_dp_async(self, source_name:str, signal_name:str, session:Session) -> TSPoint:
+        hit, point = self._cached_latest_dp(source_name, signal_name, session)
+        if hit:
+            return point
+        with stage("read_latest_dp", "query"):
+            rows = await execute_async(session, *await self._latest_dp_query(source_name, signal_name, session))
+        return self._cache_latest_dp(source_name, signal_name, row_to_tspoint(rows[0] if rows else None), session)
+
+    """
+    Returns the latest datapoint of many signals. Cached points are answered from memory,
+    the others are read concurrently with at most read_concurrency queries in flight.
+    """
+    async def read_latest_dps_async(self, signals:list[SignalRef], session:Session) -> list[LatestDataPoint]:
+        points:dict[int, TSPoint|None] = dict()
+        missed = list()
+        for index, signal in enumerate(signals):
+            hit, point = self._cached_latest_dp(signal.source_name, signal.signal_name, session)
+            if hit:
+                points[index] = point
             else:
-                return None
+                missed.append(index)
+        with stage("read_latest_dps", "query"):
+            results = await execute_concurrent_async(session, [await self._latest_dp_query(signals[index].source_name, signals[index].signal_name, session) for index in missed], concurrency=self.__read_concurrency__)
+        for index, (success, result) in zip(missed, results):
+            if not success:
+                raise result
+            points[index] = self._cache_latest_dp(signals[index].source_name, signals[index].signal_name, row_to_tspoint(result[0] if result else None), session)
+        return [LatestDataPoint(source_name=signal.source_name, signal_name=signal.signal_name, point=points[index]) for index, signal in enumerate(signals)]
+
+    def _cached_latest_dp(self, source_name:str, signal_name:str, session:Session) -> tuple:
+        if self.__latest_dp_cache__ is None:
+            return False, None
+        return self.__latest_dp_cache__.get(self._cache_scope(session), clean_name(source_name), clean_name(signal_name))
+
+    def _cache_latest_dp(self, source_name:str, signal_name:str, point:TSPoint|None, session:Session) -> TSPoint|None:
+        if self.__latest_dp_cache__ is not None:
+            self.__latest_dp_cache__.put(self._cache_scope(session), clean_name(source_name), clean_name(signal_name), point)
+        return point
+
+    async def _latest_dp_query(self, source_name:str, signal_name:str, session:Session) -> tuple:
+        query = await self._prepare_async(session, f"SELECT event_time, value_int, value_float, value_text, value_bigint, value_double FROM {{ks}}.{SIGNAL_LAST_DP_TABLE} WHERE signal_name = ? AND source_name = ? LIMIT 1", ConsistencyLevel.QUORUM)
+        return query, (clean_name(signal_name), clean_name(source_name))
+
+def rows_to_sources(rows:list) -> list:
+    sources = list()
+    for row in rows:
+        sources.append(Source(unique_name=row.unique_name, meta_info=row.meta_info, meta_zone=row.meta_zone))
+    return sources
+
+def rows_to_signals(rows:list) -> list:
+    signals = list()
+    for row in rows:
+        # Rows with only a datatype belong to signals that were written but never added
+        if row.meta_info is None:
+            continue
+        signals.append(Signal(unique_name=row.name, meta_info=row.meta_info, source_name=row.source_name, datatype=TSType(row.datatype) if row.datatype else None))
+    return signals
+
+"""
+Splits data table rows into one Timeseries per value type. Rows of a typed table all belong
+to its datatype, so they are decoded without checking the value columns of every row.
+"""
+def rows_to_timeseries(rows:list, datatype:TSType|None = None) -> tuple:
+    if datatype is not None:
+        t_points = [TSPoint(timestamp=row.event_time, value=row.value) for row in rows]
+        return tuple(Timeseries(datatype=ts_type, tsPoints=t_points if ts_type == datatype else list()) for ts_type in (TSType.INT, TSType.FLOAT, TSType.STRING))
+    ts_points_int = list()
+    ts_points_float = list()
+    ts_points_text = list()
+    for row in rows:
+        if(row.value_int is not None):
+            t_point = TSPoint(timestamp=row.event_time, value=row.value_int)
+            ts_points_int.append(t_point)
+        elif(row.value_float is not None):
+            t_point = TSPoint(timestamp=row.event_time, value=row.value_float)
+            ts_points_float.append(t_point)
+        elif(row.value_text is not None):
+            t_point = TSPoint(timestamp=row.event_time, value=row.value_text)
+            ts_points_text.append(t_point)
+    ts_int = Timeseries(datatype=TSType.INT, tsPoints=ts_points_int)
+    ts_float = Timeseries(datatype=TSType.FLOAT, tsPoints=ts_points_float)
+    ts_string = Timeseries(datatype=TSType.STRING, tsPoints=ts_points_text)
+    return ts_int, ts_float, ts_string
+
+"""The name of a stored datatype as the columnar, aggregation and rollup functions take it"""
+def datatype_name(datatype:TSType|None) -> str|None:
+    return datatype.value if datatype is not None else None
+
+def row_to_tspoint(row) -> TSPoint|None:
+    if not row == None :
+        if(row.value_bigint is not None):
+            return TSPoint(timestamp=row.event_time, value=row.value_bigint)
+        elif(row.value_double is not None):
+            return TSPoint(timestamp=row.event_time, value=row.value_double)
+        elif(row.value_int is not None):
+            return TSPoint(timestamp=row.event_time, value=row.value_int)
+        elif(row.value_float is not None):
+            return TSPoint(timestamp=row.event_time, value=row.value_float)
+        elif(row.value_text is not None):
+            return TSPoint(timestamp=row.event_time, value=row.value_text)
+        else:
+            return None
+    else:
+        return None
+
+def rows_to_multi_columnar(rows_per_signal:list, datatypes:list) -> list[ColumnarTimeseries]:
+    return [rows_to_columnar(rows, datatype_name(datatype)) for rows, datatype in zip(rows_per_signal, datatypes)]
+
+"""Aligns the rows of numeric signals on a common grid, see Database.read_timeseries_aligned_async"""
+def align_rows(rows_per_signal:list, datatypes:list, signals:list[SignalRef], start_time:datetime, end_time:datetime, alignment:Alignment, bucket_ms:int) -> AlignedColumns:
+    start_ms = int(as_utc(start_time).timestamp() * 1000)
+    end_ms = int(as_utc(end_time).timestamp() * 1000)
+    grid = time_grid(start_ms, end_ms, bucket_ms)
+    values = np.empty((len(signals), len(grid)))
+    for index, (rows, datatype) in enumerate(zip(rows_per_signal, datatypes)):
+        timestamps, signal_values = rows_to_arrays(rows, datatype_name(datatype))
+        if alignment == Alignment.FFILL:
+            values[index] = align_ffill(timestamps, signal_values, grid)
         else:
-            return None
\ No newline at end of file
+            values[index] = align_buckets(timestamps, signal_values, grid, bucket_ms)
+    return AlignedColumns([(signal.source_name, signal.signal_name) for signal in signals], grid, values)
+
+"""Returns the window in epoch ms and the bucket width and count, deriving the one of bucket_ms and points that is None"""
+def resolve_buckets(start_time:datetime, end_time:datetime, bucket_ms:int|None, points:int|None) -> tuple:
+    start_ms = int(as_utc(start_time).timestamp() * 1000)
+    end_ms = int(as_utc(end_time).timestamp() * 1000)
+    if bucket_ms is None:
+        bucket_ms = max(1, -(-(end_ms - start_ms + 1) // points))
+    if points is None:
+        points = max(1, -(-(end_ms - start_ms + 1) // bucket_ms))
+    return start_ms, end_ms, bucket_ms, points
+
+"""Returns the epoch-ms timestamps of the points of a write that were not reported as failed"""
+def written_timestamps(timeseries:Timeseries, failures:list[PointFailure]) -> np.ndarray:
+    failed = {failure.index for failure in failures}
+    return np.array([(as_utc(t_point.timestamp) - EPOCH_UTC) // ONE_MS for index, t_point in enumerate(timeseries.tsPoints) if index not in failed], dtype=np.int64)
+
+"""Reduces rows of a numeric signal, see Database.read_timeseries_aggregated"""
+def aggregate_rows(rows:list, start_time:datetime, end_time:datetime, mode:AggregationMode, bucket_ms:int|None, points:int|None, datatype:str|None = None) -> AggregatedTimeseries|DownsampledTimeseries:
+    start_ms, end_ms, bucket_ms, points = resolve_buckets(start_time, end_time, bucket_ms, points)
+    timestamps, values = rows_to_arrays(rows, datatype)
+    if mode == AggregationMode.LTTB:
+        return lttb(timestamps, values, points)
+    return bucket_aggregate(timestamps, values, start_ms, bucket_ms)
@@ -0,0 +1,153 @@
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+import bisect, threading, time
+
+# Same fields as the rows the driver returns for legacy and typed data tables, so cached rows decode the same way
+HotRow = namedtuple("HotRow", "event_time value_int value_float value_text")
+TypedHotRow = namedtuple("TypedHotRow", "event_time value")
+# Tail fetches start this far before the last sync, so points that were in flight during it are picked up
+TAIL_OVERLAP = timedelta(seconds=5)
+
+"""
+The recent rows of one signal in ascending time order. All rows of the data table between
+covered_from and synced_to were loaded at synced_at, points written through this process
+are added as they are written. The whole window was last read at loaded_at.
+"""
+class SignalWindow:
+    __slots__ = ("timestamps", "rows", "covered_from", "synced_to", "synced_at", "loaded_at")
+    def __init__(self, covered_from:datetime, synced_to:datetime):
+        self.timestamps:list[datetime] = list()
+        self.rows:list = list()
+        self.covered_from = covered_from
+        self.synced_to = synced_to
+        self.synced_at = time.monotonic()
+        self.loaded_at = self.synced_at
+
+    """Inserts rows in time order, a row replaces a cached row with the same timestamp like in the data table"""
+    def merge(self, rows) -> int:
+        added = 0
+        for row in rows:
+            position = bisect.bisect_left(self.timestamps, row.event_time)
+            if position < len(self.timestamps) and self.timestamps[position] == row.event_time:
+                self.rows[position] = row
+            else:
+                self.timestamps.insert(position, row.event_time)
+                self.rows.insert(position, row)
+                added += 1
+        return added
+
+    """Drops the rows before the start of the window, returns their number"""
+    def trim(self, window_start:datetime) -> int:
+        if window_start <= self.covered_from:
+            return 0
+        self.covered_from = window_start
+        position = bisect.bisect_left(self.timestamps, window_start)
+        del self.timestamps[:position]
+        del self.rows[:position]
+        return position
+
+"""
+In-memory ring of the last span_sek of rows per signal, filled by reads of recent windows
+and by writes through this process. Windows are keyed by (scope, table), the scope being the
+credential key of the reader that loaded it, so a window is only served to the credentials
+it was read with. Reads are answered from it as long as the window was synced with the
+database at most ttl_sek ago, afterwards the tail since the last sync is fetched again, so
+points written by other processes show up after at most ttl_sek. Points written elsewhere
+with older timestamps than the tail, e.g. late or backfilled ones, are picked up by reloading
+the whole window once it was loaded more than reload_sek ago.
+At most max_points rows are held across all signals, least recently used signals are
+evicted first.
+"""
+class HotWindowCache:
+    def __init__(self, span_sek:float, ttl_sek:float, max_points:int, reload_sek:float = 300):
+        self.__span__ = timedelta(seconds=span_sek)
+        self.__ttl_sek__ = ttl_sek
+        self.__max_points__ = max_points
+        self.__reload_sek__ = reload_sek
+        self.__windows__:OrderedDict[tuple, SignalWindow] = OrderedDict()
+        # The keys of the windows per table, so writes reach the windows of every scope
+        self.__keys_by_table__:dict[str, set] = dict()
+        self.__lock__ = threading.Lock()
+        self.points = 0
+
+    def window_start(self) -> datetime:
+        return utc_now() - self.__span__
+
+    """True if the window starting at start_time lies within the span of the cache"""
+    def covers(self, start_time:datetime) -> bool:
+        return start_time >= self.window_start()
+
+    """
+    Returns (fresh, synced_to) of the window of a signal, synced_to is None if it is not cached
+    or has to be reloaded completely
+    """
+    def state(self, key:tuple) -> tuple:
+        with self.__lock__:
+            window = self.__windows__.get(key)
+            now = time.monotonic()
+            if window is None or now - window.loaded_at > self.__reload_sek__:
+                return False, None
+            return now - window.synced_at <= self.__ttl_sek__, window.synced_to
+
+    """Returns the cached rows between start_time and end_time newest first, None if the window is not cached or stale"""
+    def rows(self, key:tuple, start_time:datetime, end_time:datetime) -> list|None:
+        with self.__lock__:
+            window = self.__windows__.get(key)
+            now = time.monotonic()
+            if window is None or now - window.synced_at > self.__ttl_sek__ or now - window.loaded_at > self.__reload_sek__:
+                return None
+            self.points -= window.trim(self.window_start())
+            if start_time < window.covered_from:
+                return None
+            self.__windows__.move_to_end(key)
+            first = bisect.bisect_left(window.timestamps, start_time)
+            last = bisect.bisect_right(window.timestamps, end_time)
+            return window.rows[first:last][::-1]
+
+    """Stores the rows read for the whole window of a signal"""
+    def load(self, key:tuple, rows:list, covered_from:datetime, synced_to:datetime):
+        window = SignalWindow(covered_from, synced_to)
+        window.rows = sorted(rows, key=lambda row: row.event_time)
+        window.timestamps = [row.event_time for row in window.rows]
+        with self.__lock__:
+            previous = self.__windows__.pop(key, None)
+            if previous is not None:
+                self.points -= len(previous.rows)
+            self.__windows__[key] = window
+            self.__keys_by_table__.setdefault(key[1], set()).add(key)
+            self.points += len(window.rows)
+            self._evict()
+
+    """Merges the rows of a tail fetch up to synced_to into the window of a signal"""
+    def extend(self, key:tuple, rows:list, synced_to:datetime):
+        with self.__lock__:
+            window = self.__windows__.get(key)
+            if window is None:
+                return
+            self.points += window.merge(sorted(rows, key=lambda row: row.event_time))
+            self.points -= window.trim(self.window_start())
+            window.synced_to = synced_to
+            window.synced_at = time.monotonic()
+            self.__windows__.move_to_end(key)
+            self._evict()
+
+    """Adds written rows to the windows of a table in every scope that has it cached"""
+    def add_written(self, tablename:str, rows:list):
+        with self.__lock__:
+            for key in self.__keys_by_table__.get(tablename, ()):
+                window = self.__windows__[key]
+                self.points += window.merge(row for row in rows if row.event_time >= window.covered_from)
+            self._evict()
+
+    def _evict(self):
+        while self.points > self.__max_points__ and self.__windows__:
+            key, window = self.__windows__.popitem(last=False)
+            self.points -= len(window.rows)
+            keys = self.__keys_by_table__[key[1]]
+            keys.discard(key)
+            if not keys:
+                del self.__keys_by_table__[key[1]]
+
+"""The current time as naive UTC datetime, the way the driver returns timestamps"""
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
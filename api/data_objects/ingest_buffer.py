@@ -0,0 +1,105 @@
+from cassandra.cluster import Session
+from data_objects.database_objects import Database, Timeseries, TSType, clean_name
+from data_objects.session_manager import SessionManager, SessionLease, UnpooledLease, borrow_session
+from data_objects.metrics import count_background
+import asyncio, logging
+
+log = logging.getLogger()
+
+"""Points of one data table waiting to be flushed with the borrowed session of their writers"""
+class PendingWrite:
+    def __init__(self, lease:SessionLease|UnpooledLease, source_name:str, signal_name:str, datatype:TSType):
+        self.lease = lease
+        self.source_name = source_name
+        self.signal_name = signal_name
+        self.datatype = datatype
+        self.points = list()
+
+"""
+Acknowledges writes after enqueueing them and coalesces the points per data table
+(and per credentials, so points are always written with the credentials of their writer).
+The session is borrowed from the session_manager until the points are flushed, so it is not
+evicted in the meantime. A table is flushed by a background task once it holds flush_points
+points or at the latest every flush_interval_sek. At most max_points points are buffered or
+being flushed, enqueue() refuses writes beyond that so the API can apply backpressure.
+Points are acknowledged before they are persisted, failed flushes are logged and counted in
+the api_background_tasks metric.
+"""
+class IngestBuffer:
+    def __init__(self, database:Database, session_manager:SessionManager|None = None, max_points:int = 100000, flush_points:int = 1000, flush_interval_sek:float = 1.0):
+        self.__database__ = database
+        self.__session_manager__ = session_manager
+        self.__max_points__ = max_points
+        self.__flush_points__ = flush_points
+        self.__flush_interval_sek__ = flush_interval_sek
+        self.__pending__:dict[tuple, PendingWrite] = dict()
+        self.__flushes__:set[asyncio.Task] = set()
+        self.__loop_task__:asyncio.Task|None = None
+        self.buffered_points = 0
+
+    def start(self):
+        self.__loop_task__ = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    """True if a write of that many points can ever be buffered, larger ones have to be written directly"""
+    def fits(self, point_count:int) -> bool:
+        return point_count <= self.__max_points__
+
+    """Buffers the points, returns False if the buffer is full"""
+    def enqueue(self, source_name:str, signal_name:str, timeseries:Timeseries, session:Session) -> bool:
+        if self.buffered_points + len(timeseries.tsPoints) > self.__max_points__:
+            return False
+        lease = borrow_session(self.__session_manager__, session)
+        credentials = lease.credential_key if lease.credential_key is not None else id(session)
+        key = (credentials, clean_name(source_name), clean_name(signal_name), timeseries.datatype)
+        pending = self.__pending__.get(key)
+        if pending is None:
+            pending = PendingWrite(lease, source_name, signal_name, timeseries.datatype)
+            self.__pending__[key] = pending
+        else:
+            # The pending write holds a lease of the same session already
+            lease.release()
+        pending.points.extend(timeseries.tsPoints)
+        self.buffered_points += len(timeseries.tsPoints)
+        if len(pending.points) >= self.__flush_points__:
+            self._start_flush(key)
+        return True
+
+    def _start_flush(self, key:tuple):
+        pending = self.__pending__.pop(key, None)
+        if pending is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._flush(pending))
+        self.__flushes__.add(task)
+        task.add_done_callback(self.__flushes__.discard)
+
+    async def _flush(self, pending:PendingWrite):
+        succeeded = False
+        try:
+            timeseries = Timeseries(datatype=pending.datatype, tsPoints=pending.points)
+            result = await self.__database__.write_timeseries_async(pending.source_name, pending.signal_name, timeseries, pending.lease.session)
+            succeeded = result.applied
+            if not result.applied:
+                log.error(f"Buffered write of {pending.source_name} {pending.signal_name} lost {len(result.failures)} of {len(pending.points)} points.")
+        except Exception:
+            log.exception(f"Buffered write of {len(pending.points)} points of {pending.source_name} {pending.signal_name} failed.")
+        finally:
+            pending.lease.release()
+            count_background("ingest_buffer", succeeded)
+            self.buffered_points -= len(pending.points)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.__flush_interval_sek__)
+            for key in list(self.__pending__):
+                self._start_flush(key)
+
+    """Stops the background flushing and writes out everything that is still buffered"""
+    async def drain(self):
+        if self.__loop_task__ is not None:
+            self.__loop_task__.cancel()
+            self.__loop_task__ = None
+        for key in list(self.__pending__):
+            self._start_flush(key)
+        if self.__flushes__:
+            log.info(f"Draining {self.buffered_points} buffered points.")
+            await asyncio.gather(*self.__flushes__, return_exceptions=True)
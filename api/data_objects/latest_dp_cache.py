@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from datetime import datetime
+import threading, time, pytz
+
+"""
+In-process cache of the latest datapoint per (scope, source, signal). It is written through
+by timeseries writes and filled by reads that missed. Entries expire after ttl_sek, which
+bounds how stale a value written by another process can be. The scope is the credential key
+of the caller's session, so a hit is only served to the credentials whose query or write
+filled the entry, and writes of other credentials become visible after ttl_sek as well.
+"""
+class LatestPointCache:
+    def __init__(self, ttl_sek:float, max_entries:int = 100000):
+        self.__ttl_sek__ = ttl_sek
+        self.__max_entries__ = max_entries
+        self.__entries__:OrderedDict[tuple, tuple] = OrderedDict()
+        self.__lock__ = threading.Lock()
+
+    """Returns (True, point) on a hit, the point may be None if the signal has no data. Returns (False, None) on a miss."""
+    def get(self, scope, source_name:str, signal_name:str) -> tuple:
+        key = (scope, source_name, signal_name)
+        with self.__lock__:
+            entry = self.__entries__.get(key)
+            if entry is None:
+                return False, None
+            point, stored_at = entry
+            if time.monotonic() - stored_at > self.__ttl_sek__:
+                del self.__entries__[key]
+                return False, None
+            return True, point
+
+    """Stores a point read from the database"""
+    def put(self, scope, source_name:str, signal_name:str, point):
+        with self.__lock__:
+            self._store((scope, source_name, signal_name), point)
+
+    """Stores a point that was just written to the latest datapoint table"""
+    def put_written(self, scope, source_name:str, signal_name:str, point):
+        # Normalized so cached and database answers look the same, the database keeps milliseconds
+        timestamp = utc_naive(point.timestamp)
+        timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+        self.put(scope, source_name, signal_name, point.model_copy(update={"timestamp": timestamp}))
+
+    def _store(self, key:tuple, point):
+        self.__entries__[key] = (point, time.monotonic())
+        self.__entries__.move_to_end(key)
+        while len(self.__entries__) > self.__max_entries__:
+            self.__entries__.popitem(last=False)
+
+"""Returns the timestamp as naive UTC datetime, the way the driver returns timestamps"""
+def utc_naive(timestamp:datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(pytz.utc).replace(tzinfo=None)
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from pydantic import BaseModel
+import hashlib, json, time
+
+"""
+An immutable snapshot of the sources and signals of a keyspace. The JSON bodies and ETags
+of the listings are computed once per snapshot, so unchanged lists are served without
+touching the database or re-encoding the models.
+"""
+class CatalogSnapshot:
+    def __init__(self, sources:list, signals:list, generation:int):
+        self.sources = sources
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+        self.__signals_by_source__:dict[str, list] = dict()
+        for signal in signals:
+            self.__signals_by_source__.setdefault(signal.source_name, list()).append(signal)
+        self.sources_body, self.sources_etag = encode_listing(sources)
+        self.__signal_listings__:dict[str, tuple] = dict()
+
+    def signals(self, source_name:str) -> list:
+        return self.__signals_by_source__.get(source_name, list())
+
+    def all_signals(self) -> list:
+        return [signal for signals in self.__signals_by_source__.values() for signal in signals]
+
+    """Returns the JSON body and the ETag of the signal listing of a source"""
+    def signals_listing(self, source_name:str) -> tuple:
+        listing = self.__signal_listings__.get(source_name)
+        if listing is None:
+            listing = encode_listing(self.signals(source_name))
+            self.__signal_listings__[source_name] = listing
+        return listing
+
+"""
+Holds the current CatalogSnapshot of a Database per scope, the credential key of the
+session it was loaded with, so a snapshot is only served to the credentials that read it.
+All snapshots are dropped by invalidate() when sources or signals are added through this
+process and are considered stale after refresh_interval_sek, so changes made by other
+processes are picked up as well. At most max_scopes snapshots are kept, the least recently
+used are dropped first.
+"""
+class MetadataCatalog:
+    def __init__(self, refresh_interval_sek:float, max_scopes:int = 64):
+        self.__refresh_interval_sek__ = refresh_interval_sek
+        self.__max_scopes__ = max_scopes
+        self.__snapshots__:OrderedDict[object, CatalogSnapshot] = OrderedDict()
+        self.generation = 0
+
+    """Returns the current snapshot of the scope or None if it has to be (re)loaded"""
+    def current(self, scope) -> CatalogSnapshot|None:
+        snapshot = self.__snapshots__.get(scope)
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.__refresh_interval_sek__:
+            return None
+        self.__snapshots__.move_to_end(scope)
+        return snapshot
+
+    """Stores a loaded snapshot of the scope, unless the catalog was invalidated while it was loading"""
+    def store(self, scope, snapshot:CatalogSnapshot):
+        if snapshot.generation != self.generation:
+            return
+        self.__snapshots__[scope] = snapshot
+        self.__snapshots__.move_to_end(scope)
+        while len(self.__snapshots__) > self.__max_scopes__:
+            self.__snapshots__.popitem(last=False)
+
+    def invalidate(self):
+        self.generation += 1
+        self.__snapshots__.clear()
+
+"""Returns the JSON body of a list of models and a strong ETag derived from it"""
+def encode_listing(models:list[BaseModel]) -> tuple:
+    body = json.dumps([model.model_dump(mode="json") for model in models], separators=(",", ":")).encode("utf-8")
+    return body, '"%s"' % hashlib.sha1(body).hexdigest()
+
+"""True if the If-None-Match header matches the ETag"""
+def etag_matches(if_none_match:str|None, etag:str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
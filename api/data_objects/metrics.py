@@ -0,0 +1,164 @@
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+import cProfile, glob, logging, os, random, re, tempfile, threading, time
+
+log = logging.getLogger()
+
+# prometheus_client keeps the metrics of all worker processes in files of this directory if it is set before its import
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+# Collectors of state only one process can see, e.g. its sessions, are kept apart from the shared metrics
+PROCESS_REGISTRY = CollectorRegistry() if MULTIPROC_DIR is not None else REGISTRY
+
+# Latencies reach from cached reads below a millisecond to large range reads of many seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+REQUEST_LATENCY = Histogram("api_request_duration_seconds", "Time from receiving a request until its response is sent, per route", ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+STAGE_LATENCY = Histogram("api_stage_duration_seconds", "Time spent in one stage (connect, query, decode, encode, ...) of an operation", ["operation", "stage"], buckets=LATENCY_BUCKETS)
+ROWS_RETURNED = Histogram("api_rows_returned", "Rows read from the database or the hot window per read", ["operation"], buckets=ROW_BUCKETS)
+POINTS_INGESTED = Counter("api_points_ingested", "Points of write requests, by datatype and whether they were written", ["datatype", "result"])
+BACKGROUND_TASKS = Counter("api_background_tasks", "Flushes of the ingest buffer and rollup updates run in the background, by whether they succeeded", ["task", "result"])
+# Requests that did not match a route share one label, so unknown paths can not blow up the number of series
+UNMATCHED_ROUTE = "unmatched"
+
+"""Times the enclosed block as the given stage of an operation"""
+@contextmanager
+def stage(operation:str, name:str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(operation, name).observe(time.perf_counter() - started)
+
+def observe_rows(operation:str, rows:int):
+    ROWS_RETURNED.labels(operation).observe(rows)
+
+def count_points(datatype:str, written:int, failed:int):
+    POINTS_INGESTED.labels(datatype, "written").inc(written)
+    if failed:
+        POINTS_INGESTED.labels(datatype, "failed").inc(failed)
+
+def count_background(task:str, succeeded:bool):
+    BACKGROUND_TASKS.labels(task, "succeeded" if succeeded else "failed").inc()
+
+"""
+Returns the body and media type of a scrape of all registered metrics. With several worker
+processes the histograms and counters are summed over all workers, the process collectors
+report the state of the worker that answers the scrape.
+"""
+def metrics_response() -> tuple:
+    if MULTIPROC_DIR is None:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, MULTIPROC_DIR)
+    return generate_latest(registry) + generate_latest(PROCESS_REGISTRY), CONTENT_TYPE_LATEST
+
+def register_process_collector(collector):
+    PROCESS_REGISTRY.register(collector)
+
+def unregister_process_collector(collector):
+    PROCESS_REGISTRY.unregister(collector)
+
+"""
+Prepares the directory of the shared metrics before worker processes are started: the
+given one is emptied, as files of earlier runs would be summed into the metrics, without
+one a temporary directory is used. Returns the directory, the workers inherit it as
+PROMETHEUS_MULTIPROC_DIR.
+"""
+def prepare_multiprocess_dir(directory:str|None) -> str:
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="api-metrics-")
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+    return directory
+
+"""
+Reports the counters of a SessionManager and the connection pools of its sessions at
+scrape time: open connections and requests in flight per cassandra host, summed over
+the sessions of all credentials.
+"""
+class SessionCollector:
+    def __init__(self, session_manager):
+        self.__session_manager__ = session_manager
+
+    def collect(self):
+        stats = self.__session_manager__.stats()
+        for name in ("hits", "misses", "evictions"):
+            yield CounterMetricFamily(f"api_session_cache_{name}", f"Session cache {name} of the session manager", value=stats[name])
+        yield GaugeMetricFamily("api_sessions", "Open pooled cassandra sessions", value=stats["size"])
+        open_connections = dict()
+        in_flight = dict()
+        for session in self.__session_manager__.sessions():
+            for host, state in session.get_pool_state().items():
+                address = str(host.endpoint)
+                open_connections[address] = open_connections.get(address, 0) + state["open_count"]
+                in_flight[address] = in_flight.get(address, 0) + sum(state["in_flights"])
+        connections_family = GaugeMetricFamily("cassandra_pool_open_connections", "Open driver connections per host", labels=["host"])
+        in_flight_family = GaugeMetricFamily("cassandra_pool_in_flight_requests", "Driver requests in flight per host", labels=["host"])
+        for address in open_connections:
+            connections_family.add_metric([address], open_connections[address])
+            in_flight_family.add_metric([address], in_flight[address])
+        yield connections_family
+        yield in_flight_family
+
+"""
+ASGI middleware recording the latency of every request per route template, so reads of
+different signals share one series. The latency lasts until the last body chunk is sent,
+streamed responses are measured completely.
+With profile_sample_rate > 0 that share of the requests is run under cProfile and the
+stats are dumped to profile_dir as <method>_<route>_<time>.prof, at most one at a time.
+The profile covers the event loop thread, so other requests served meanwhile show up in it.
+"""
+class RequestMetricsMiddleware:
+    def __init__(self, app, profile_sample_rate:float = 0.0, profile_dir:str = "profiles"):
+        self.app = app
+        self.__profile_sample_rate__ = profile_sample_rate
+        self.__profile_dir__ = profile_dir
+        self.__profiling__ = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = self._start_profile()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            route_path = route.path if route is not None else UNMATCHED_ROUTE
+            REQUEST_LATENCY.labels(scope["method"], route_path, str(status)).observe(time.perf_counter() - started)
+            if profiler is not None:
+                self._dump_profile(profiler, scope["method"], route_path)
+
+    def _start_profile(self) -> cProfile.Profile|None:
+        if self.__profile_sample_rate__ <= 0 or random.random() >= self.__profile_sample_rate__:
+            return None
+        # Only one profiler can be active per thread
+        if not self.__profiling__.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _dump_profile(self, profiler:cProfile.Profile, method:str, route_path:str):
+        profiler.disable()
+        try:
+            os.makedirs(self.__profile_dir__, exist_ok=True)
+            name = re.sub(r"[^A-Za-z0-9]+", "_", route_path).strip("_") or "root"
+            profiler.dump_stats(os.path.join(self.__profile_dir__, f"{method}_{name}_{time.time_ns()}.prof"))
+        except OSError as exc:
+            log.warning(f"Profile of {method} {route_path} could not be written: {exc}")
+        finally:
+            self.__profiling__.release()
@@ -0,0 +1,101 @@
+from cassandra.cluster import Session
+from data_objects.metrics import stage, count_background
+from data_objects.session_manager import SessionManager, SessionLease, UnpooledLease, borrow_session
+import asyncio, logging
+import numpy as np
+
+log = logging.getLogger()
+
+"""Timestamps of one signal whose rollup buckets still have to be recomputed"""
+class PendingRollup:
+    def __init__(self, lease:SessionLease|UnpooledLease, source_name:str, signal_name:str):
+        self.lease = lease
+        self.source_name = source_name
+        self.signal_name = signal_name
+        self.timestamps:list[np.ndarray] = list()
+        self.first_ms:int|None = None
+
+"""
+Recomputes rollups in the background instead of in the write requests. The timestamps of
+writes are collected per data table and recomputed by one task per table, delay_sek after the
+first write that arrived since the last recomputation, so a signal written every second costs
+one recomputation per delay instead of one per write. As there is only one task per table, the
+recomputations of a signal never overlap within the process. Other processes writing the same
+signal recompute concurrently, a bucket written by both may be left with the older result
+until it is written again or the backfill is run.
+The session of a pending recomputation is borrowed from the session_manager until it ran,
+failed recomputations are logged and counted in the api_background_tasks metric.
+"""
+class RollupScheduler:
+    def __init__(self, update, delay_sek:float = 1.0, session_manager:SessionManager|None = None):
+        self.__update__ = update
+        self.__delay_sek__ = delay_sek
+        self.__session_manager__ = session_manager
+        self.__pending__:dict[str, PendingRollup] = dict()
+        # The earliest timestamp of the recomputation running per table
+        self.__running_from__:dict[str, int] = dict()
+        self.__tasks__:dict[str, asyncio.Task] = dict()
+        self.__draining__ = asyncio.Event()
+
+    """Queues the timestamps for recomputation, the latest writer's session is used for it"""
+    def schedule(self, tablename:str, source_name:str, signal_name:str, timestamps_ms:np.ndarray, session:Session):
+        lease = borrow_session(self.__session_manager__, session)
+        pending = self.__pending__.get(tablename)
+        if pending is None:
+            pending = PendingRollup(lease, source_name, signal_name)
+            self.__pending__[tablename] = pending
+        else:
+            pending.lease.release()
+            pending.lease = lease
+        pending.timestamps.append(timestamps_ms)
+        first_ms = int(timestamps_ms.min())
+        pending.first_ms = first_ms if pending.first_ms is None else min(pending.first_ms, first_ms)
+        if tablename not in self.__tasks__:
+            self.__tasks__[tablename] = asyncio.get_running_loop().create_task(self._run(tablename))
+
+    async def _run(self, tablename:str):
+        try:
+            # Points written while a recomputation runs are picked up by the next round
+            while tablename in self.__pending__:
+                await self._wait()
+                pending = self.__pending__.pop(tablename)
+                self.__running_from__[tablename] = pending.first_ms
+                succeeded = False
+                try:
+                    with stage("rollups", "update"):
+                        await self.__update__(pending.source_name, pending.signal_name, np.unique(np.concatenate(pending.timestamps)), pending.lease.session)
+                    succeeded = True
+                except Exception as exc:
+                    log.warning(f"Rollups of {tablename} could not be updated: {exc}")
+                finally:
+                    self.__running_from__.pop(tablename, None)
+                    pending.lease.release()
+                    count_background("rollups", succeeded)
+        finally:
+            self.__tasks__.pop(tablename, None)
+
+    """
+    Returns the earliest timestamp of the table whose rollups are not recomputed yet by this
+    process, None if nothing is pending. Rollups from there on may miss recent writes.
+    """
+    def pending_from(self, tablename:str) -> int|None:
+        candidates = list()
+        pending = self.__pending__.get(tablename)
+        if pending is not None and pending.first_ms is not None:
+            candidates.append(pending.first_ms)
+        if tablename in self.__running_from__:
+            candidates.append(self.__running_from__[tablename])
+        return min(candidates) if candidates else None
+
+    async def _wait(self):
+        try:
+            await asyncio.wait_for(self.__draining__.wait(), self.__delay_sek__)
+        except asyncio.TimeoutError:
+            pass
+
+    """Recomputes everything that is still pending right away and waits for it, used on shutdown"""
+    async def drain(self):
+        self.__draining__.set()
+        if self.__tasks__:
+            log.info(f"Recomputing the rollups of {len(self.__tasks__)} signals.")
+            await asyncio.gather(*self.__tasks__.values(), return_exceptions=True)
@@ -0,0 +1,187 @@
+from data_objects.aggregation import EPOCH, ONE_MS, AggregatedTimeseries
+from datetime import date, datetime
+import numpy as np
+
+ROLLUP_TABLE_PREFIX = "rollup_"
+
+def day_period(timestamp_ms:int) -> date:
+    return (EPOCH + int(timestamp_ms) * ONE_MS).date()
+
+def month_period(timestamp_ms:int) -> date:
+    return day_period(timestamp_ms).replace(day=1)
+
+def year_period(timestamp_ms:int) -> date:
+    return day_period(timestamp_ms).replace(month=1, day=1)
+
+def ms_of(day:date) -> int:
+    return (datetime(day.year, day.month, day.day) - EPOCH) // ONE_MS
+
+def as_datetime(timestamp_ms:int) -> datetime:
+    return EPOCH + int(timestamp_ms) * ONE_MS
+
+"""
+A rollup resolution. Its rows are partitioned per (source, signal, period) with periods
+chosen so a partition holds at most a few thousand buckets: a day of minutes, a month of
+hours or a year of days. A bucket never spans two partitions of the next finer level.
+"""
+class RollupLevel:
+    __slots__ = ("name", "bucket_ms", "period_of")
+    def __init__(self, name:str, bucket_ms:int, period_of):
+        self.name = name
+        self.bucket_ms = bucket_ms
+        self.period_of = period_of
+
+    @property
+    def table(self) -> str:
+        return f"{ROLLUP_TABLE_PREFIX}{self.name}"
+
+    """Returns the periods of all partitions holding buckets between first_ms and last_ms, oldest first"""
+    def periods(self, first_ms:int, last_ms:int) -> list[date]:
+        periods = list()
+        period = self.period_of(first_ms)
+        last_period = self.period_of(last_ms)
+        while period <= last_period:
+            periods.append(period)
+            period = next_period(period, self.period_of)
+        return periods
+
+def next_period(period:date, period_of) -> date:
+    if period_of is day_period:
+        return day_period(ms_of(period) + 86400000)
+    if period_of is month_period:
+        return date(period.year + period.month // 12, period.month % 12 + 1, 1)
+    return date(period.year + 1, 1, 1)
+
+# Finest first, every level is computed from the one before it
+ROLLUP_LEVELS = (
+    RollupLevel("1m", 60000, day_period),
+    RollupLevel("1h", 3600000, month_period),
+    RollupLevel("1d", 86400000, year_period),
+)
+
+"""
+Ascending rollup buckets as column arrays. Raw points are buckets of a single point, so
+raw rows and rollup rows are reduced the same way.
+"""
+class Rollups:
+    __slots__ = ("timestamps", "min", "max", "sum", "count", "first", "last")
+    def __init__(self, timestamps:np.ndarray, min:np.ndarray, max:np.ndarray, sum:np.ndarray, count:np.ndarray, first:np.ndarray, last:np.ndarray):
+        self.timestamps = timestamps
+        self.min = min
+        self.max = max
+        self.sum = sum
+        self.count = count
+        self.first = first
+        self.last = last
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @staticmethod
+    def from_points(timestamps:np.ndarray, values:np.ndarray) -> "Rollups":
+        return Rollups(timestamps, values, values, values, np.ones(len(timestamps), dtype=np.int64), values, values)
+
+    """Builds the rollups of ascending driver rows of a data table, text values are left out. datatype is set for rows of typed data tables."""
+    @staticmethod
+    def from_data_rows(rows:list, datatype:str|None = None) -> "Rollups":
+        if datatype is not None:
+            numeric = rows if datatype != "STRING" else list()
+            timestamps = np.fromiter(((row.event_time - EPOCH) // ONE_MS for row in numeric), dtype=np.int64, count=len(numeric))
+            return Rollups.from_points(timestamps, np.fromiter((row.value for row in numeric), dtype=np.float64, count=len(numeric)))
+        numeric = [row for row in rows if row.value_int is not None or row.value_float is not None]
+        timestamps = np.fromiter(((row.event_time - EPOCH) // ONE_MS for row in numeric), dtype=np.int64, count=len(numeric))
+        values = np.fromiter((row.value_float if row.value_float is not None else row.value_int for row in numeric), dtype=np.float64, count=len(numeric))
+        return Rollups.from_points(timestamps, values)
+
+    """Builds the rollups of ascending driver rows of a rollup table"""
+    @staticmethod
+    def from_rollup_rows(rows:list) -> "Rollups":
+        count = len(rows)
+        column = lambda name, dtype: np.fromiter((getattr(row, name) for row in rows), dtype=dtype, count=count)
+        timestamps = np.fromiter(((row.bucket_start - EPOCH) // ONE_MS for row in rows), dtype=np.int64, count=count)
+        return Rollups(timestamps, column("value_min", np.float64), column("value_max", np.float64), column("value_sum", np.float64), column("value_count", np.int64), column("value_first", np.float64), column("value_last", np.float64))
+
+    """Concatenates non overlapping rollups and orders them by time"""
+    @staticmethod
+    def concat(parts:list) -> "Rollups":
+        merged = Rollups(*(np.concatenate([getattr(part, name) for part in parts]) if parts else np.empty(0) for name in Rollups.__slots__))
+        order = np.argsort(merged.timestamps, kind="stable")
+        return Rollups(*(getattr(merged, name)[order] for name in Rollups.__slots__))
+
+    """Reduces the rollups into buckets of bucket_ms starting at origin_ms, empty buckets are left out"""
+    def combine(self, bucket_ms:int, origin_ms:int = 0) -> "Rollups":
+        if len(self) == 0:
+            return self
+        bucket_ids = (self.timestamps - origin_ms) // bucket_ms
+        buckets, starts = np.unique(bucket_ids, return_index=True)
+        ends = np.append(starts[1:], len(self)) - 1
+        return Rollups(
+            origin_ms + buckets * bucket_ms,
+            np.minimum.reduceat(self.min, starts),
+            np.maximum.reduceat(self.max, starts),
+            np.add.reduceat(self.sum, starts),
+            np.add.reduceat(self.count, starts),
+            self.first[starts],
+            self.last[ends],
+        )
+
+    """Returns only the buckets starting at one of the given timestamps"""
+    def select(self, bucket_starts:np.ndarray) -> "Rollups":
+        selected = np.isin(self.timestamps, bucket_starts)
+        return Rollups(*(getattr(self, name)[selected] for name in Rollups.__slots__))
+
+    def to_aggregated(self, bucket_ms:int) -> AggregatedTimeseries:
+        return AggregatedTimeseries(
+            bucket_ms=bucket_ms,
+            timestamps=self.timestamps.tolist(),
+            min=self.min.tolist(),
+            max=self.max.tolist(),
+            mean=(self.sum / self.count).tolist(),
+            count=self.count.tolist(),
+            first=self.first.tolist(),
+            last=self.last.tolist(),
+        )
+
+"""Returns the sorted unique starts of the buckets of bucket_ms that contain the timestamps"""
+def affected_buckets(timestamps_ms:np.ndarray, bucket_ms:int) -> np.ndarray:
+    return np.unique(timestamps_ms // bucket_ms * bucket_ms)
+
+"""
+Returns the (period, first_ms, last_ms) ranges to read from the partitions of the next finer
+level (period_of) to recompute the given buckets, one range per partition.
+"""
+def source_ranges(bucket_starts:np.ndarray, bucket_ms:int, period_of) -> list:
+    ranges:dict[date, list] = dict()
+    for bucket_start in bucket_starts.tolist():
+        period = period_of(bucket_start)
+        bucket_range = ranges.setdefault(period, [bucket_start, bucket_start])
+        bucket_range[1] = bucket_start
+    return [(period, first_ms, last_ms + bucket_ms - 1) for period, (first_ms, last_ms) in ranges.items()]
+
+"""
+Splits the window start_ms..end_ms (inclusive) for a bucket aggregation into segments that
+are read from the coarsest usable rollup level, finer levels and finally raw rows (level None)
+cover the ragged end. bucket_ms is rounded down to a multiple of the finest level, the
+coarsest level whose width divides it is used and start_ms is rounded down to one of its
+buckets, so none of its buckets spans two result buckets. The first result bucket may
+therefore start up to one rollup bucket before start_ms. Rollups are only read up to
+rollups_until_ms, everything after it is read from raw rows. Returns the segments with the
+effective start_ms and bucket_ms, None if bucket_ms is narrower than the finest level.
+"""
+def plan_rollup_read(start_ms:int, end_ms:int, bucket_ms:int, rollups_until_ms:int|None = None) -> tuple|None:
+    if bucket_ms < ROLLUP_LEVELS[0].bucket_ms:
+        return None
+    bucket_ms = bucket_ms // ROLLUP_LEVELS[0].bucket_ms * ROLLUP_LEVELS[0].bucket_ms
+    usable = [level for level in ROLLUP_LEVELS if bucket_ms % level.bucket_ms == 0]
+    start_ms = start_ms // usable[-1].bucket_ms * usable[-1].bucket_ms
+    segments = list()
+    cursor = start_ms
+    rollups_end_ms = end_ms if rollups_until_ms is None else min(end_ms, rollups_until_ms)
+    for level in reversed(usable):
+        aligned_end = (rollups_end_ms + 1) // level.bucket_ms * level.bucket_ms
+        if aligned_end > cursor:
+            segments.append((level, cursor, aligned_end - 1))
+            cursor = aligned_end
+    if cursor <= end_ms:
+        segments.append((None, cursor, end_ms))
+    return segments, start_ms, bucket_ms
@@ -0,0 +1,277 @@
+from cassandra.cluster import Cluster, Session, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.auth import PlainTextAuthProvider
+from cassandra.policies import TokenAwarePolicy, DCAwareRoundRobinPolicy
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from data_objects.metrics import stage
+import hashlib, logging, os, threading, time, weakref
+
+log = logging.getLogger()
+
+"""One authenticated cluster connection held by the SessionManager"""
+class PooledSession:
+    def __init__(self, key:tuple, cluster:Cluster, session:Session):
+        self.key = key
+        self.cluster = cluster
+        self.session = session
+        self.last_used = time.monotonic()
+        self.borrowed = 0
+
+    def shutdown(self):
+        try:
+            self.cluster.shutdown()
+        except Exception:
+            log.exception("Failed to shut down pooled cassandra cluster.")
+
+"""
+A session borrowed from the SessionManager, it is not evicted before release() is called.
+Releasing a lease more than once has no effect.
+"""
+class SessionLease:
+    def __init__(self, manager:"SessionManager", entry:PooledSession):
+        self.__manager__ = manager
+        self.__entry__ = entry
+        self.__released__ = False
+
+    @property
+    def session(self) -> Session:
+        return self.__entry__.session
+
+    @property
+    def credential_key(self) -> tuple:
+        return self.__entry__.key
+
+    def release(self):
+        if self.__released__:
+            return
+        self.__released__ = True
+        self.__manager__._release(self.__entry__)
+
+"""Stands in for a lease of a session no SessionManager pools, releasing it has no effect"""
+class UnpooledLease:
+    def __init__(self, session:Session):
+        self.session = session
+        self.credential_key = None
+
+    def release(self):
+        pass
+
+"""
+Borrows a session for background work that outlives its request, so the session manager
+does not shut it down before the work is done. Without a manager, or for sessions it does
+not pool, the session is used as it is.
+"""
+def borrow_session(session_manager:"SessionManager|None", session:Session) -> "SessionLease|UnpooledLease":
+    lease = session_manager.lease_session(session) if session_manager is not None else None
+    return lease if lease is not None else UnpooledLease(session)
+
+"""
+Caches one Cluster/Session per (username, password-hash), so that requests reuse
+an already authenticated connection instead of doing the full handshake, auth and
+topology discovery on every call. Entries that are idle for longer than
+idle_timeout_sek are shut down, and at most max_entries sessions are kept open.
+Sessions that are borrowed with a lease are never evicted, the limit may be exceeded
+until they are released. Evicted clusters are shut down in a background thread.
+"""
+class SessionManager:
+    def __init__(self, contact_points:list, port:int, max_entries:int = 32, idle_timeout_sek:float = 600.0):
+        self.__contact_points__ = contact_points
+        self.__port__ = port
+        self.__max_entries__ = max_entries
+        self.__idle_timeout_sek__ = idle_timeout_sek
+        # The salt keeps the cache keys from being plain password hashes
+        self.__salt__ = os.urandom(16)
+        self.__entries__:OrderedDict[tuple, PooledSession] = OrderedDict()
+        self.__lock__ = threading.Lock()
+        self.__connect_locks__:dict[tuple, threading.Lock] = dict()
+        self.__keys__:weakref.WeakKeyDictionary[Session, tuple] = weakref.WeakKeyDictionary()
+        self.__shutdown_executor__ = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cassandra-shutdown")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def credential_key(self, username:str, password:str) -> tuple:
+        password_hash = hashlib.sha256(self.__salt__ + password.encode("utf-8")).hexdigest()
+        return (username, password_hash)
+
+    """Returns the credential key a session was connected with, None for sessions of other managers"""
+    def credential_key_of(self, session:Session) -> tuple|None:
+        with self.__lock__:
+            return self.__keys__.get(session)
+
+    """Returns the cached session for the given credentials without ever connecting, None on a miss"""
+    def get_cached_session(self, username:str, password:str) -> Session|None:
+        entry = self._lookup(self.credential_key(username, password))
+        return entry.session if entry is not None else None
+
+    """Returns the cached session of a credential key without ever connecting and marks it as used, None on a miss"""
+    def get_cached_session_by_key(self, key:tuple) -> Session|None:
+        entry = self._lookup(key)
+        return entry.session if entry is not None else None
+
+    """Borrows the cached session of a credential key without ever connecting, None on a miss"""
+    def lease_cached_by_key(self, key:tuple) -> SessionLease|None:
+        entry = self._lookup(key, borrow=True)
+        return SessionLease(self, entry) if entry is not None else None
+
+    """Borrows a session that is still cached once more, None if it was evicted in the meantime"""
+    def lease_session(self, session:Session) -> SessionLease|None:
+        key = self.credential_key_of(session)
+        if key is None:
+            return None
+        with self.__lock__:
+            entry = self.__entries__.get(key)
+            if entry is None or entry.session is not session or session.is_shutdown:
+                return None
+            entry.borrowed += 1
+        return SessionLease(self, entry)
+
+    """
+    Returns the cached session for the given credentials or connects a new one.
+    Raises the driver exception if the connection can not be established.
+    """
+    def get_session(self, username:str, password:str) -> Session:
+        return self._get_entry(username, password, borrow=False).session
+
+    """Like get_session, but the session is borrowed until the returned lease is released"""
+    def lease(self, username:str, password:str) -> SessionLease:
+        return SessionLease(self, self._get_entry(username, password, borrow=True))
+
+    def _get_entry(self, username:str, password:str, borrow:bool) -> PooledSession:
+        key = self.credential_key(username, password)
+        entry = self._lookup(key, borrow=borrow)
+        if entry is not None:
+            return entry
+        with self.__lock__:
+            connect_lock = self.__connect_locks__.setdefault(key, threading.Lock())
+        # Only one thread connects per credential, the others wait and reuse the result
+        with connect_lock:
+            entry = self._lookup(key, count=False, borrow=borrow)
+            if entry is not None:
+                return entry
+            with self.__lock__:
+                self.misses += 1
+            cluster, session = self._connect(username, password)
+            entry = PooledSession(key, cluster, session)
+            with self.__lock__:
+                if borrow:
+                    entry.borrowed += 1
+                self.__entries__[key] = entry
+                self.__keys__[session] = key
+                evicted = self._pop_over_limit()
+            self._shutdown_entries(evicted)
+            return entry
+
+    """Connects a new cluster with the given credentials, raises the driver exception on failure"""
+    def _connect(self, username:str, password:str) -> tuple[Cluster, Session]:
+        # Token aware routing sends bound prepared statements straight to a replica
+        profile = ExecutionProfile(load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy()))
+        cluster = Cluster(contact_points=self.__contact_points__, port=self.__port__, execution_profiles={EXEC_PROFILE_DEFAULT: profile})
+        cluster.auth_provider = PlainTextAuthProvider(username=username, password=password)
+        try:
+            with stage("session", "connect"):
+                return cluster, cluster.connect()
+        except Exception:
+            cluster.shutdown()
+            raise
+
+    def _lookup(self, key:tuple, count:bool = True, borrow:bool = False) -> PooledSession|None:
+        with self.__lock__:
+            evicted = self._pop_idle(time.monotonic())
+            entry = self.__entries__.get(key)
+            if entry is not None and entry.session.is_shutdown:
+                del self.__entries__[key]
+                entry = None
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self.__entries__.move_to_end(key)
+                if borrow:
+                    entry.borrowed += 1
+                if count:
+                    self.hits += 1
+        self._shutdown_entries(evicted)
+        return entry
+
+    def _release(self, entry:PooledSession):
+        with self.__lock__:
+            entry.borrowed -= 1
+            entry.last_used = time.monotonic()
+            if self.__entries__.get(entry.key) is entry:
+                self.__entries__.move_to_end(entry.key)
+            # Entries that were kept over the limit because they were borrowed go now
+            evicted = self._pop_over_limit()
+        self._shutdown_entries(evicted)
+
+    """Must be called while holding the lock, returns the removed entries"""
+    def _pop_idle(self, now:float) -> list:
+        evicted = list()
+        for key, entry in list(self.__entries__.items()):
+            if entry.borrowed > 0:
+                continue
+            # Entries are kept in LRU order, the first fresh one ends the scan
+            if now - entry.last_used < self.__idle_timeout_sek__:
+                break
+            self._pop_entry(key)
+            evicted.append(entry)
+        self.evictions += len(evicted)
+        return evicted
+
+    """Must be called while holding the lock, evicts the least recently used entries nobody borrowed"""
+    def _pop_over_limit(self) -> list:
+        evicted = list()
+        for key, entry in list(self.__entries__.items()):
+            if len(self.__entries__) <= self.__max_entries__:
+                break
+            if entry.borrowed > 0:
+                continue
+            self._pop_entry(key)
+            evicted.append(entry)
+        self.evictions += len(evicted)
+        return evicted
+
+    def _pop_entry(self, key:tuple):
+        del self.__entries__[key]
+        self.__connect_locks__.pop(key, None)
+
+    """Shuts the clusters down in the background thread, so the event loop never waits for it"""
+    def _shutdown_entries(self, entries:list):
+        for entry in entries:
+            log.info("Shutting down evicted cassandra session.")
+            try:
+                self.__shutdown_executor__.submit(entry.shutdown)
+            except RuntimeError:
+                # The manager was shut down already
+                entry.shutdown()
+
+    """Shuts down every session that was idle for longer than the idle timeout"""
+    def evict_idle(self):
+        with self.__lock__:
+            evicted = self._pop_idle(time.monotonic())
+        self._shutdown_entries(evicted)
+
+    """Returns the hit/miss/eviction counters and the current number of sessions"""
+    def stats(self) -> dict:
+        with self.__lock__:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.__entries__),
+            }
+
+    """Returns the currently cached sessions"""
+    def sessions(self) -> list:
+        with self.__lock__:
+            return [entry.session for entry in self.__entries__.values()]
+
+    """Shuts down all cached sessions, used on application shutdown"""
+    def shutdown(self):
+        with self.__lock__:
+            entries = list(self.__entries__.values())
+            self.__entries__.clear()
+            self.__connect_locks__.clear()
+        log.info("Shutting down %d cached cassandra sessions. Stats: %s" % (len(entries), self.stats()))
+        # Waits for evicted clusters that are still shutting down in the background
+        self.__shutdown_executor__.shutdown(wait=True)
+        for entry in entries:
+            entry.shutdown()
@@ -0,0 +1,42 @@
+from cassandra.cluster import Session
+from cassandra.query import PreparedStatement
+from data_objects.async_bridge import SingleFlight
+import asyncio, logging, threading, weakref
+
+log = logging.getLogger()
+
+"""
+Registry of prepared statements per session. Statements are prepared lazily on
+first use of a query (and therefore of each data_<source>_<signal> table) and
+reused afterwards, so the coordinator does not have to parse the CQL again.
+Sessions are held weakly, statements go away together with an evicted session.
+"""
+class StatementCache:
+    def __init__(self):
+        self.__statements__:weakref.WeakKeyDictionary[Session, dict] = weakref.WeakKeyDictionary()
+        self.__lock__ = threading.Lock()
+        self.__single_flight__ = SingleFlight()
+
+    def _cached(self, session:Session, cql:str, consistency_level) -> PreparedStatement|None:
+        with self.__lock__:
+            return self.__statements__.setdefault(session, dict()).get((cql, consistency_level))
+
+    def get(self, session:Session, cql:str, consistency_level) -> PreparedStatement:
+        statement = self._cached(session, cql, consistency_level)
+        if statement is not None:
+            return statement
+        log.debug("Preparing statement: %s" % cql)
+        statement = session.prepare(cql)
+        statement.consistency_level = consistency_level
+        with self.__lock__:
+            return self.__statements__.setdefault(session, dict()).setdefault((cql, consistency_level), statement)
+
+    """
+    Async variant of get. session.prepare blocks until the coordinator answered, so misses
+    are prepared in a worker thread, and concurrent misses of the same statement share it.
+    """
+    async def get_async(self, session:Session, cql:str, consistency_level) -> PreparedStatement:
+        statement = self._cached(session, cql, consistency_level)
+        if statement is not None:
+            return statement
+        return await self.__single_flight__.run(("prepare", id(session), cql, consistency_level), lambda: asyncio.to_thread(self.get, session, cql, consistency_level))
@@ -0,0 +1,81 @@
+from cassandra.cluster import Session
+from cassandra.query import SimpleStatement
+from data_objects.async_bridge import execute_async
+import asyncio, logging, threading
+
+log = logging.getLogger()
+
+"""
+Registry of the tables of a keyspace, so data tables are created once instead of sending
+CREATE TABLE IF NOT EXISTS with every write. It is loaded from system_schema.tables at
+startup. Tables unknown to it are looked up in the schema metadata of the driver, which
+the control connection keeps current from schema change events, so tables created by
+other processes are found without a query. Missing tables are created under a lock per
+table, concurrent first writes of a table wait for one CREATE TABLE instead of racing.
+For every table the CQL type of its single `value` column is kept, if it has one and not
+the legacy value_int/value_float/value_text columns, so reads know the layout of data tables.
+"""
+class TableRegistry:
+    def __init__(self, keyspace_name:str):
+        self.__keyspace_name__ = keyspace_name
+        self.__tables__:dict[str, str|None] = dict()
+        self.__lock__ = threading.Lock()
+        self.__async_create_locks__:dict[str, asyncio.Lock] = dict()
+
+    def load(self, session:Session):
+        query = SimpleStatement("SELECT table_name, column_name, type FROM system_schema.columns WHERE keyspace_name = %s")
+        columns:dict[str, dict[str, str]] = dict()
+        for row in session.execute(query, (self.__keyspace_name__,)):
+            columns.setdefault(row.table_name, dict())[row.column_name] = row.type
+        tables = {tablename: typed_value_type(table_columns) for tablename, table_columns in columns.items()}
+        with self.__lock__:
+            self.__tables__.update(tables)
+        log.info(f"Loaded {len(tables)} tables of keyspace {self.__keyspace_name__}.")
+
+    """True if the table is known to exist, either from the registry or from the schema metadata of the driver"""
+    def exists(self, tablename:str, session:Session) -> bool:
+        if tablename in self.__tables__:
+            return True
+        keyspace = session.cluster.metadata.keyspaces.get(self.__keyspace_name__)
+        if keyspace is not None and tablename in keyspace.tables:
+            table_columns = {name: column.cql_type for name, column in keyspace.tables[tablename].columns.items()}
+            self.add(tablename, typed_value_type(table_columns))
+            return True
+        return False
+
+    def add(self, tablename:str, value_type:str|None = None):
+        with self.__lock__:
+            self.__tables__[tablename] = value_type
+
+    """Returns the CQL type of the value column of a typed table, None for other and unknown tables"""
+    def value_type(self, tablename:str, session:Session) -> str|None:
+        if not self.exists(tablename, session):
+            return None
+        return self.__tables__.get(tablename)
+
+    """
+    Executes the DDL of the table unless it exists, concurrent callers for the same table wait
+    for the first one. Returns True only to the caller that created the table.
+    """
+    async def ensure_async(self, tablename:str, ddl:str, session:Session, value_type:str|None = None) -> bool:
+        if self.exists(tablename, session):
+            return False
+        # Only touched from the event loop
+        create_lock = self.__async_create_locks__.setdefault(tablename, asyncio.Lock())
+        async with create_lock:
+            if self.exists(tablename, session):
+                return False
+            log.info(f"Creating table {tablename}.")
+            await execute_async(session, ddl)
+            self.add(tablename, value_type)
+        self.__async_create_locks__.pop(tablename, None)
+        return True
+
+"""
+Returns the type of the value column of a table given its column types. Tables that still
+hold the legacy columns count as legacy, e.g. while a migration has not dropped them yet.
+"""
+def typed_value_type(columns:dict) -> str|None:
+    if "value_int" in columns:
+        return None
+    return columns.get("value")
@@ -0,0 +1,43 @@
+from collections import OrderedDict
+import hashlib, threading, time
+
+"""
+Bounded LRU of verified API tokens. A token that was decoded and authenticated against the
+database once is mapped to the credential key of its pooled session, so repeated requests
+with the same token skip the JWT decode. The session itself is resolved through the
+SessionManager on every request, which keeps sessions in use from being evicted as idle.
+Entries expire after max_age_sek or at the exp claim of the token, whichever comes first.
+Tokens are only kept as SHA-256 digests.
+"""
+class TokenCache:
+    def __init__(self, max_age_sek:float, max_entries:int = 10000):
+        self.__max_age_sek__ = max_age_sek
+        self.__max_entries__ = max_entries
+        self.__entries__:OrderedDict[bytes, tuple] = OrderedDict()
+        self.__lock__ = threading.Lock()
+
+    """Returns the credential key of a verified token, None if the token is unknown or expired"""
+    def get(self, token:str) -> tuple|None:
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        with self.__lock__:
+            entry = self.__entries__.get(key)
+            if entry is None:
+                return None
+            credential_key, expires_at = entry
+            if time.time() >= expires_at:
+                del self.__entries__[key]
+                return None
+            self.__entries__.move_to_end(key)
+            return credential_key
+
+    """Stores a verified token, exp is the expiry claim of the token as unix timestamp if it has one"""
+    def put(self, token:str, credential_key:tuple, exp:float|None = None):
+        expires_at = time.time() + self.__max_age_sek__
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        with self.__lock__:
+            self.__entries__[key] = (credential_key, expires_at)
+            self.__entries__.move_to_end(key)
+            while len(self.__entries__) > self.__max_entries__:
+                self.__entries__.popitem(last=False)
@@ -0,0 +1,72 @@
+import argparse, asyncio, dotenv, logging, os
+from data_objects.database_objects import Database, DatatypeMismatchError, Signal, TSType, clean_name
+from data_objects.session_manager import SessionManager
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+"""
+Converts the legacy data tables (value_int, value_float and value_text columns) of all signals
+of the keyspace, or of a single one, into typed tables with one value column. The datatype of
+a signal is taken from --datatype, from meta_signals or from the first point of its table.
+Tables holding points of more than one datatype are left as they are. Stop the API while
+migrating, running processes keep the layout of the tables they loaded at startup.
+"""
+def main():
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser(description="Migrates legacy data tables to typed data tables.")
+    parser.add_argument("--source", help="only migrate signals of this source")
+    parser.add_argument("--signal", help="only migrate this signal, requires --source")
+    parser.add_argument("--datatype", choices=[datatype.value for datatype in TSType], help="datatype of the migrated signals, instead of detecting it")
+    parser.add_argument("--dry-run", action="store_true", help="only print which tables would be migrated to which datatype")
+    args = parser.parse_args()
+    session_manager = SessionManager(contact_points=os.environ.get("CASSANDRA_URLS").split(","), port=int(os.environ.get("CASSANDRA_PORT")))
+    try:
+        session = session_manager.get_session(os.environ.get("CASSANDRA_USERNAME"), os.environ.get("CASSANDRA_PASSWORD"))
+        wide_values = os.environ.get("WIDE_VALUES", "false").lower() in ("1", "true", "yes")
+        database = Database(keyspace_name=os.environ.get("CASSANDRA_KEYSPACE"), typed_tables=True, wide_values=wide_values, data_ttl_sek=int(os.environ.get("DATA_TTL_SEK", "0")), compaction_window_days=int(os.environ.get("COMPACTION_WINDOW_DAYS", "1")))
+        database.ensure_database_structure(session)
+        if(args.signal is not None):
+            signals = [(clean_name(args.source), clean_name(args.signal))]
+        else:
+            signals = [signal for signal in database.data_signals(session) if args.source is None or signal[0] == clean_name(args.source)]
+        # Signals added with a datatype know it already, meta_signals holds the names as they were added
+        registered = {(clean_name(signal.source_name), clean_name(signal.unique_name)): signal for signal in asyncio.run(database.metadata_snapshot_async(session)).all_signals() if is_clean(signal)}
+        for source_name, signal_name in signals:
+            if(database.stored_datatype(source_name, signal_name, session) is not None):
+                continue
+            signal = registered.get((source_name, signal_name))
+            if(args.datatype is not None):
+                datatype = TSType(args.datatype)
+            elif(signal is not None and signal.datatype is not None):
+                datatype = signal.datatype
+            else:
+                datatype = database.sample_datatype(source_name, signal_name, session)
+            if(datatype is None):
+                log.warning(f"Skipping {source_name} {signal_name}, it holds no points to detect its datatype from, pass --datatype.")
+                continue
+            if(args.dry_run):
+                log.info(f"Would migrate {source_name} {signal_name} to {datatype.value}.")
+                continue
+            try:
+                points = database.migrate_to_typed(source_name, signal_name, datatype, session)
+            except DatatypeMismatchError as exc:
+                log.warning(f"Skipping {source_name} {signal_name}: {exc}")
+                continue
+            if(signal is not None):
+                asyncio.run(database.add_signal_async(Signal(meta_info=signal.meta_info, unique_name=signal.unique_name, source_name=signal.source_name, datatype=datatype), session))
+            log.info(f"Migrated {source_name} {signal_name} to {datatype.value} with {points} points.")
+    finally:
+        session_manager.shutdown()
+
+"""True if the names of a registered signal can be mapped to a data table"""
+def is_clean(signal:Signal) -> bool:
+    try:
+        clean_name(signal.source_name)
+        clean_name(signal.unique_name)
+        return True
+    except ValueError:
+        return False
+
+if(__name__ == '__main__'):
+    main()
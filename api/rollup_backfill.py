@@ -0,0 +1,39 @@
+import argparse, asyncio, dotenv, logging, os
+from data_objects.database_objects import Database
+from data_objects.session_manager import SessionManager
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+"""
+Computes the rollup tables from the data already stored, for all signals of the keyspace
+or for a single one. Needed once after rollups are enabled for a keyspace with existing
+data, and safe to rerun at any time since buckets are recomputed, not incremented.
+"""
+def main():
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser(description="Backfills the 1m/1h/1d rollup tables from the data tables.")
+    parser.add_argument("--source", help="only backfill signals of this source")
+    parser.add_argument("--signal", help="only backfill this signal, requires --source")
+    args = parser.parse_args()
+    session_manager = SessionManager(contact_points=os.environ.get("CASSANDRA_URLS").split(","), port=int(os.environ.get("CASSANDRA_PORT")))
+    try:
+        session = session_manager.get_session(os.environ.get("CASSANDRA_USERNAME"), os.environ.get("CASSANDRA_PASSWORD"))
+        database = Database(keyspace_name=os.environ.get("CASSANDRA_KEYSPACE"), rollups_enabled=True)
+        database.ensure_database_structure(session)
+        if(args.signal is not None):
+            signals = [(args.source, args.signal)]
+        else:
+            signals = [signal for signal in database.data_signals(session) if args.source is None or signal[0] == args.source]
+        asyncio.run(backfill(database, signals, session))
+    finally:
+        session_manager.shutdown()
+
+"""Backfills the rollups of the signals one after the other"""
+async def backfill(database:Database, signals:list, session):
+    for source_name, signal_name in signals:
+        days = await database.backfill_rollups_async(source_name, signal_name, session)
+        log.info(f"Backfilled rollups of {source_name} {signal_name} for {days} days.")
+
+if(__name__ == '__main__'):
+    main()
@@ -0,0 +1,221 @@
+import argparse, asyncio, dotenv, json, multiprocessing, os, random, sys, time
+import httpx
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from signal_generator import SignalGenerator, timeseries_payload
+#Env var loading
+dotenv.load_dotenv()
+
+OPERATIONS = ("write", "read_range", "last_datapoint")
+# Only used with --fake, so the api can be imported without a configured .env
+FAKE_ENV = {
+    "CASSANDRA_URLS": "127.0.0.1",
+    "CASSANDRA_PORT": "9042",
+    "CASSANDRA_KEYSPACE": "benchmark",
+    "JWT_SECRET": "benchmark",
+}
+
+"""
+Collects the latencies of the requests that were scheduled inside the measured
+window, requests of the warmup are sent but not recorded
+"""
+class Recorder:
+    def __init__(self, measure_from:float, measure_to:float):
+        self.measure_from = measure_from
+        self.measure_to = measure_to
+        self.latencies = {operation: list() for operation in OPERATIONS}
+        self.errors = {operation: 0 for operation in OPERATIONS}
+
+    def record(self, operation:str, scheduled:float, latency:float, ok:bool):
+        if not (self.measure_from <= scheduled < self.measure_to):
+            return
+        self.latencies[operation].append(latency)
+        if not ok:
+            self.errors[operation] += 1
+
+    """Adds the latencies and errors recorded by the recorder of another process"""
+    def merge(self, latencies:dict, errors:dict):
+        for operation in OPERATIONS:
+            self.latencies[operation].extend(latencies[operation])
+            self.errors[operation] += errors[operation]
+
+    def summary(self) -> dict:
+        duration = self.measure_to - self.measure_from
+        results = dict()
+        for operation in OPERATIONS:
+            latencies = np.array(self.latencies[operation]) * 1000
+            p50, p90, p99, maximum = np.percentile(latencies, [50, 90, 99, 100]) if len(latencies) else (0.0, 0.0, 0.0, 0.0)
+            results[operation] = {
+                "requests": len(latencies),
+                "errors": self.errors[operation],
+                "req_per_sek": len(latencies) / duration,
+                "p50_ms": p50,
+                "p90_ms": p90,
+                "p99_ms": p99,
+                "max_ms": maximum,
+            }
+        return results
+
+"""
+Sends one request and records its latency. Latency is counted from the time the request
+was scheduled, not from when it was sent, so a slow api can not hide its queueing delay
+by slowing down the load (the load is open loop).
+"""
+async def timed(client:httpx.AsyncClient, recorder:Recorder, operation:str, scheduled:float, method:str, path:str, **kwargs):
+    try:
+        response = await client.request(method, path, **kwargs)
+        ok = response.status_code in (200, 202)
+    except httpx.HTTPError:
+        ok = False
+    recorder.record(operation, scheduled, time.perf_counter() - scheduled, ok)
+
+"""Schedules send() every interval seconds until the deadline, without waiting for earlier requests"""
+async def open_loop(interval:float, offset:float, deadline:float, send):
+    pending = set()
+    scheduled = time.perf_counter() + offset
+    while scheduled < deadline:
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        task = asyncio.create_task(send(scheduled))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        scheduled += interval
+    if pending:
+        await asyncio.gather(*pending)
+
+def signal_name(format:str) -> str:
+    return f"bench{format.lower()}"
+
+def write_request(source_name:str, format:str, value) -> tuple:
+    return "PUT", f"/writeTimeseriesData/{source_name}/{signal_name(format)}/", {"json": timeseries_payload(format, value, datetime.now(timezone.utc))}
+
+"""
+Simulates one device: a writer sending the values of every publish format like the
+simulator does, a reader of the last read_window_sek and a reader of the last datapoint
+"""
+async def run_source(client:httpx.AsyncClient, recorder:Recorder, args, source_name:str, rng:random.Random, deadline:float):
+    generator = SignalGenerator(args.formats, rng)
+    window = timedelta(seconds=args.read_window_sek)
+
+    async def write(scheduled:float):
+        await asyncio.gather(*(timed(client, recorder, "write", scheduled, method, path, **kwargs) for method, path, kwargs in (write_request(source_name, format, value) for format, value in generator.next_values())))
+
+    async def read_range(scheduled:float):
+        end_time = datetime.now(timezone.utc)
+        params = {"start_time": (end_time - window).isoformat(), "end_time": end_time.isoformat()}
+        await timed(client, recorder, "read_range", scheduled, "GET", f"/readTimeseriesData/{source_name}/{signal_name(rng.choice(args.formats))}/", params=params)
+
+    async def last_datapoint(scheduled:float):
+        await timed(client, recorder, "last_datapoint", scheduled, "GET", f"/getLastDataPoint/{source_name}/{signal_name(rng.choice(args.formats))}/")
+
+    # Sources start at random offsets so they do not all send in lockstep
+    loops = [
+        (args.write_interval, write),
+        (args.read_interval, read_range),
+        (args.last_interval, last_datapoint),
+    ]
+    await asyncio.gather(*(open_loop(interval, rng.uniform(0, interval), deadline, send) for interval, send in loops if interval > 0))
+
+"""
+Runs the sources of one process, every process_count-th source starting at process_index.
+With a barrier all processes start their load together once their signals exist.
+"""
+async def run(client:httpx.AsyncClient, args, process_index:int = 0, barrier = None) -> Recorder:
+    master = random.Random(args.seed)
+    sources = [(f"benchsrc{index}", random.Random(master.getrandbits(64))) for index in range(args.sources)][process_index::args.processes]
+    # One point per signal first, so readers never hit a signal that does not exist yet
+    for source_name, rng in sources:
+        for format, value in SignalGenerator(args.formats, random.Random(rng.random())).next_values():
+            method, path, kwargs = write_request(source_name, format, value)
+            response = await client.request(method, path, **kwargs)
+            response.raise_for_status()
+    if barrier is not None:
+        await asyncio.to_thread(barrier.wait)
+    started = time.perf_counter()
+    recorder = Recorder(started + args.warmup, started + args.warmup + args.duration)
+    await asyncio.gather(*(run_source(client, recorder, args, source_name, rng, recorder.measure_to) for source_name, rng in sources))
+    return recorder
+
+"""
+Imports the api in-process with a FakeSession instead of a cassandra cluster, so the
+api itself is measured without database latency except the simulated latency_sek
+"""
+def load_fake_api(latency_sek:float):
+    from fake_session import FakeSession
+    for name, value in FAKE_ENV.items():
+        os.environ.setdefault(name, value)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+    import api_main
+    session = FakeSession(latency_sek)
+    # Every credential connects to the same fake, the session manager itself runs unchanged
+    api_main.session_manager._connect = lambda username, password: (session.cluster, session)
+    api_main.database.ensure_database_structure(session)
+    return api_main
+
+async def run_benchmark(args, process_index:int = 0, barrier = None) -> Recorder:
+    connections = max(1, -(-args.sources // args.processes) * (len(args.formats) + 2))
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    if(args.fake):
+        api_main = load_fake_api(args.fake_latency_ms / 1000)
+        headers = {"Authorization": f"Bearer {api_main.get_jwt_token_up('benchmark', 'benchmark')}"}
+        async with api_main.lifespan(api_main.app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api_main.app), base_url="http://benchmark", headers=headers, timeout=60) as client:
+                return await run(client, args, process_index, barrier)
+    headers = {"Authorization": f"Bearer {args.token}"}
+    async with httpx.AsyncClient(base_url=args.api_url, headers=headers, limits=limits, timeout=60) as client:
+        return await run(client, args, process_index, barrier)
+
+"""Entry point of the load processes of --processes, returns what their recorder collected"""
+def run_process(args, process_index:int, barrier) -> tuple:
+    recorder = asyncio.run(run_benchmark(args, process_index, barrier))
+    return recorder.latencies, recorder.errors
+
+"""
+Spreads the sources over several processes, so a single client process does not limit the
+load. With --fake every process runs its own api, like one worker of a multi-worker api.
+"""
+def run_processes(args) -> dict:
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        barrier = manager.Barrier(args.processes)
+        with context.Pool(args.processes) as pool:
+            results = pool.starmap(run_process, [(args, process_index, barrier) for process_index in range(args.processes)])
+    recorder = Recorder(0.0, args.duration)
+    for latencies, errors in results:
+        recorder.merge(latencies, errors)
+    return recorder.summary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates many devices writing and reading concurrently and reports throughput and latency percentiles.")
+    parser.add_argument("--api-url", default=os.environ.get("API_URL"))
+    parser.add_argument("--token", default=os.environ.get("API_TOKEN"))
+    parser.add_argument("--fake", action="store_true", help="run the api in-process against an in-memory fake session instead of --api-url")
+    parser.add_argument("--fake-latency-ms", type=float, default=1.0, help="simulated latency of every database query with --fake")
+    parser.add_argument("--sources", type=int, default=10, help="number of simulated sources")
+    parser.add_argument("--formats", default=os.environ.get("PUBLISH_FORMATS", "INT,FLOAT,TEXT"), help="comma separated publish formats of every source")
+    parser.add_argument("--write-interval", type=float, default=1.0, help="seconds between writes of a source, 0 disables writes")
+    parser.add_argument("--read-interval", type=float, default=2.0, help="seconds between range reads of a source, 0 disables them")
+    parser.add_argument("--last-interval", type=float, default=1.0, help="seconds between last datapoint reads of a source, 0 disables them")
+    parser.add_argument("--read-window-sek", type=float, default=300.0, help="range reads cover the last this many seconds")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of load before measuring")
+    parser.add_argument("--processes", type=int, default=1, help="number of processes the sources are spread over, with --fake each one runs its own api")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulated values and the read targets")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    args.formats = args.formats.split(",")
+    if not args.fake and args.api_url is None:
+        parser.error("--api-url or API_URL is required without --fake")
+
+    if(args.processes > 1):
+        results = run_processes(args)
+    else:
+        results = asyncio.run(run_benchmark(args)).summary()
+    print(f"{'operation':>15} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for operation, result in results.items():
+        print(f"{operation:>15} {result['requests']:>9} {result['errors']:>7} {result['req_per_sek']:>9.1f} {result['p50_ms']:>8.1f} {result['p90_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['max_ms']:>8.1f}")
+    if(args.json is not None):
+        with open(args.json, "w") as file:
+            json.dump({"config": {key: value for key, value in vars(args).items() if key not in ("token", "json")}, "results": results}, file, indent=2)
+
+if(__name__ == '__main__'):
+    main()
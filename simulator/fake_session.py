@@ -0,0 +1,251 @@
+from cassandra.query import BatchStatement, PreparedStatement, UNSET_VALUE
+from collections import namedtuple
+from datetime import datetime, timezone
+import re, threading
+
+"""
+In-memory stand-in for a cassandra Session, so the api can be benchmarked in-process
+without a database. It understands the CQL the api sends: tables are created from their
+CREATE TABLE statement, rows are stored per partition by INSERTs and UPDATEs, and SELECTs
+with equality on the partition key, range conditions on the clustering key, ORDER BY and
+LIMIT are answered.
+Every query completes after latency_sek, simulated on a timer thread like driver I/O.
+"""
+class FakeSession:
+    is_shutdown = False
+
+    def __init__(self, latency_sek:float = 0.0):
+        self.__latency_sek__ = latency_sek
+        self.__tables__:dict[str, FakeTable] = dict()
+        self.__lock__ = threading.Lock()
+        self.keyspace = None
+        self.cluster = FakeCluster()
+        self.queries = 0
+
+    def get_pool_state(self) -> dict:
+        return dict()
+
+    def set_keyspace(self, keyspace:str):
+        self.keyspace = keyspace
+
+    def prepare(self, cql:str) -> "FakePrepared":
+        return FakePrepared(cql)
+
+    def execute(self, statement, parameters=None, **kwargs) -> "FakeResultSet":
+        return FakeResultSet(self._run(statement, parameters))
+
+    def execute_async(self, statement, parameters=None, **kwargs) -> "FakeResponseFuture":
+        try:
+            return FakeResponseFuture(self._run(statement, parameters), None, self.__latency_sek__)
+        except Exception as exc:
+            return FakeResponseFuture(None, exc, self.__latency_sek__)
+
+    def _run(self, statement, parameters) -> list:
+        with self.__lock__:
+            self.queries += 1
+            if isinstance(statement, BatchStatement):
+                for _, query_id, values in statement._statements_and_parameters:
+                    self._execute_cql(query_id.decode("utf-8"), values)
+                return list()
+            if isinstance(statement, FakeBound):
+                return self._execute_cql(statement.prepared_statement.query_string, statement.values)
+            cql = statement if isinstance(statement, str) else statement.query_string
+            return self._execute_cql(cql, parameters)
+
+    def _execute_cql(self, cql:str, parameters) -> list:
+        cql = " ".join(cql.split())
+        parameters = [normalize(value) for value in parameters or ()]
+        if cql.startswith("CREATE TABLE"):
+            table = FakeTable.from_ddl(cql)
+            self.__tables__.setdefault(table.name, table)
+            return list()
+        if cql.startswith("INSERT"):
+            self._table(INSERT_PATTERN.match(cql).group(1)).insert(INSERT_PATTERN.match(cql).group(2), parameters)
+            return list()
+        if cql.startswith("UPDATE"):
+            match = UPDATE_PATTERN.match(cql)
+            columns = [assignment.split("=")[0].strip() for assignment in match.group(2).split(",")]
+            columns += [CONDITION_PATTERN.match(condition.strip()).group(1) for condition in match.group(3).split(" AND ")]
+            self._table(match.group(1)).insert(", ".join(columns), parameters)
+            return list()
+        if cql.startswith("SELECT"):
+            match = SELECT_PATTERN.match(cql)
+            tablename = match.group("table")
+            if tablename.startswith("system_schema."):
+                return list()
+            return self._table(tablename).select(match, parameters)
+        # Keyspaces, indexes and other DDL have no effect
+        return list()
+
+    def _table(self, name:str) -> "FakeTable":
+        return self.__tables__[name.split(".")[-1]]
+
+"""The rows of a query with the parts of the driver ResultSet the api uses, always a single page"""
+class FakeResultSet(list):
+    has_more_pages = False
+
+    @property
+    def current_rows(self) -> list:
+        return self
+
+    def all(self) -> list:
+        return list(self)
+
+    def one(self):
+        return self[0] if self else None
+
+class FakeCluster:
+    def __init__(self):
+        self.metadata = FakeMetadata()
+
+    def shutdown(self):
+        pass
+
+class FakeMetadata:
+    def __init__(self):
+        self.keyspaces = dict()
+
+class FakeTable:
+    def __init__(self, name:str, partition_key:list, clustering_key:list, descending:bool):
+        self.name = name
+        self.partition_key = partition_key
+        self.clustering_key = clustering_key
+        self.descending = descending
+        self.partitions:dict[tuple, dict] = dict()
+        self.row_types:dict[tuple, type] = dict()
+
+    @staticmethod
+    def from_ddl(cql:str) -> "FakeTable":
+        name = re.search(r"CREATE TABLE (?:IF NOT EXISTS )?(\S+)", cql).group(1).split(".")[-1]
+        key = re.search(r"PRIMARY KEY \((.*?)\)\s*\)", cql).group(1)
+        if key.startswith("("):
+            partition, _, clustering = key[1:].partition(")")
+        else:
+            partition, _, clustering = key.partition(",")
+        columns = lambda text: [column.strip() for column in text.strip(" ,").split(",") if column.strip()]
+        return FakeTable(name, columns(partition), columns(clustering), "DESC)" in cql.split("CLUSTERING ORDER BY")[-1] if "CLUSTERING ORDER BY" in cql else False)
+
+    def insert(self, column_list:str, values:list):
+        # Unset values leave the column as it is, like in cassandra
+        row = {column.strip(): value for column, value in zip(column_list.split(","), values) if value is not UNSET_VALUE}
+        partition = self.partitions.setdefault(tuple(row[column] for column in self.partition_key), dict())
+        partition.setdefault(tuple(row[column] for column in self.clustering_key), dict()).update(row)
+
+    def select(self, match:re.Match, parameters:list) -> list:
+        columns = [column.strip() for column in match.group("columns").split(",")]
+        conditions = [CONDITION_PATTERN.match(condition.strip()).groups() for condition in match.group("where").split(" AND ")] if match.group("where") else list()
+        equal = {column: value for (column, operator), value in zip(conditions, parameters) if operator == "="}
+        ranges = [(column, operator, value) for (column, operator), value in zip(conditions, parameters) if operator != "="]
+        if all(column in equal for column in self.partition_key):
+            partitions = [self.partitions.get(tuple(equal[column] for column in self.partition_key), dict())]
+        else:
+            partitions = list(self.partitions.values())
+        rows = [row for partition in partitions for row in partition.values() if matches(row, equal, ranges)]
+        descending = self.descending if match.group("order") is None else match.group("order") == "DESC"
+        if self.clustering_key:
+            rows.sort(key=lambda row: tuple(row.get(column) for column in self.clustering_key), reverse=descending)
+        if match.group("limit"):
+            rows = rows[:int(match.group("limit"))]
+        row_type = self.row_types.get(tuple(columns))
+        if row_type is None:
+            row_type = self.row_types.setdefault(tuple(columns), namedtuple("Row", columns))
+        return [row_type(*(row.get(column) for column in columns)) for row in rows]
+
+class FakePrepared(PreparedStatement):
+    def __init__(self, query_string:str):
+        self.query_string = query_string
+        self.query_id = query_string.encode("utf-8")
+        self.consistency_level = None
+        self.serial_consistency_level = None
+        self.keyspace = None
+        self.routing_key_indexes = None
+        self.column_metadata = list()
+        self.custom_payload = None
+
+    def bind(self, values) -> "FakeBound":
+        return FakeBound(self, values)
+
+class FakeBound:
+    def __init__(self, prepared_statement:FakePrepared, values):
+        self.prepared_statement = prepared_statement
+        self.values = tuple(values)
+        self.keyspace = None
+        self.routing_key = None
+        self.custom_payload = None
+        self.serial_consistency_level = None
+        self.fetch_size = None
+
+"""Completes like a driver ResponseFuture with a single page, on a timer thread if there is latency"""
+class FakeResponseFuture:
+    has_more_pages = False
+
+    def __init__(self, rows:list|None, error:Exception|None, latency_sek:float):
+        self.__rows__ = rows
+        self.__error__ = error
+        self.__callbacks__ = list()
+        self.__done__ = threading.Event()
+        self.__lock__ = threading.Lock()
+        if latency_sek > 0:
+            threading.Timer(latency_sek, self._complete).start()
+        else:
+            self._complete()
+
+    def _complete(self):
+        with self.__lock__:
+            self.__done__.set()
+            callbacks, self.__callbacks__ = self.__callbacks__, list()
+        for callback, errback in callbacks:
+            self._deliver(callback, errback)
+
+    def _deliver(self, callback, errback):
+        if self.__error__ is not None:
+            errback(self.__error__)
+        else:
+            callback(self.__rows__)
+
+    def add_callbacks(self, callback, errback):
+        with self.__lock__:
+            if not self.__done__.is_set():
+                self.__callbacks__.append((callback, errback))
+                return
+        self._deliver(callback, errback)
+
+    def clear_callbacks(self):
+        with self.__lock__:
+            self.__callbacks__ = list()
+
+    def result(self) -> list:
+        self.__done__.wait()
+        if self.__error__ is not None:
+            raise self.__error__
+        return self.__rows__
+
+INSERT_PATTERN = re.compile(r"INSERT INTO (\S+) \((.*?)\) VALUES")
+UPDATE_PATTERN = re.compile(r"UPDATE (\S+) SET (.*?) WHERE (.*)$")
+SELECT_PATTERN = re.compile(r"SELECT (?:DISTINCT )?(?P<columns>.*?) FROM (?P<table>\S+)(?: WHERE (?P<where>.*?))?(?: ORDER BY \w+ (?P<order>ASC|DESC))?(?: LIMIT (?P<limit>\d+))?$")
+CONDITION_PATTERN = re.compile(r"(\w+) (=|>=|<=|>|<) \?")
+
+def matches(row:dict, equal:dict, ranges:list) -> bool:
+    for column, value in equal.items():
+        if row.get(column) != value:
+            return False
+    for column, operator, value in ranges:
+        current = row.get(column)
+        if current is None or not COMPARE[operator](current, value):
+            return False
+    return True
+
+COMPARE = {
+    ">=": lambda current, value: current >= value,
+    "<=": lambda current, value: current <= value,
+    ">": lambda current, value: current > value,
+    "<": lambda current, value: current < value,
+}
+
+"""Stores timestamps like cassandra does: UTC with millisecond precision, returned as naive datetimes"""
+def normalize(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
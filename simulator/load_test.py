@@ -0,0 +1,53 @@
+import argparse, asyncio, dotenv, os, time
+import httpx
+import numpy as np
+#Env var loading
+dotenv.load_dotenv()
+
+"""
+Keeps `concurrency` clients busy against one endpoint for `duration` seconds
+and returns the number of requests, errors and the latencies in seconds
+"""
+async def run_level(client:httpx.AsyncClient, path:str, concurrency:int, duration:float) -> tuple:
+    latencies = list()
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return len(latencies), errors, np.array(latencies)
+
+async def run(api_url:str, token:str, path:str, levels:list, duration:float):
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=api_url, headers=headers, limits=limits, timeout=60) as client:
+        print(f"{'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for concurrency in levels:
+            requests, errors, latencies = await run_level(client, path, concurrency, duration)
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if requests else (0.0, 0.0)
+            print(f"{concurrency:>8} {requests:>9} {errors:>7} {requests / duration:>9.1f} {p50:>8.1f} {p99:>8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures API throughput at increasing numbers of concurrent clients.")
+    parser.add_argument("--api-url", default=os.environ.get("API_URL"))
+    parser.add_argument("--token", default=os.environ.get("API_TOKEN"))
+    parser.add_argument("--path", default=f"/getLastDataPoint/{os.environ.get('SOURCE_NAME')}/{os.environ.get('SIGNAL_NAME')}/", help="GET endpoint to load")
+    parser.add_argument("--concurrency", default="1,100,1000", help="comma separated numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+    asyncio.run(run(args.api_url, args.token, args.path, levels, args.duration))
+
+if(__name__ == '__main__'):
+    main()
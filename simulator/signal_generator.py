@@ -0,0 +1,64 @@
+from datetime import datetime
+import random
+
+# Datatype of the api for every publish format of the simulator
+DATATYPES = {
+    "INT": "INT",
+    "FLOAT": "FLOAT",
+    "TEXT": "STRING",
+}
+
+"""
+Simulates the values of one device: an INT and a FLOAT random walk that is pulled back to
+the middle of a randomly chosen range, and a TEXT message describing the current values.
+Pass a seeded random.Random to get the same values on every run.
+"""
+class SignalGenerator:
+    def __init__(self, publish_formats:list, rng:random.Random|None = None):
+        self.publish_formats = publish_formats
+        self.rng = rng if rng is not None else random.Random()
+        generated_int_range = (self.rng.randrange(-50, 10), self.rng.randrange(11, 100))
+        generated_float_range = (float(self.rng.randrange(-10, 10)), float(self.rng.randrange(10, 40)))
+
+        self.last_int = self.rng.randrange(generated_int_range[0], generated_int_range[1]) #will be the latest int value written
+        self.spread_range_int = abs(generated_int_range[1]-generated_int_range[0])
+        self.mean_range_int = generated_int_range[0]+(self.spread_range_int/2)
+
+        self.last_float = self.rng.uniform(generated_float_range[0], generated_float_range[1]) #will be the latest float value
+        self.spread_range_float = abs(generated_float_range[1]-generated_float_range[0])
+        self.mean_range_float = generated_float_range[0]+(self.spread_range_float/2)
+
+        self.trend_int = 0
+        self.trend_float = 0.0
+
+    """Advances the simulation by one step and returns a (format, value) pair per publish format"""
+    def next_values(self) -> list:
+        # First set some trend values
+        self.trend_int = self.trend_int + ((-self.rng.random()*(float(self.last_int)-float(self.mean_range_int))* self.spread_range_int) / self.spread_range_int)*0.5
+        self.trend_float = self.trend_float + ((-self.rng.random()*(float(self.last_float)-float(self.mean_range_float))* self.spread_range_float) / self.spread_range_float)*0.5
+        values = list()
+        for format in self.publish_formats:
+            if(format == 'INT'):
+                self.last_int = int(self.last_int+self.trend_int)
+                values.append((format, self.last_int))
+            elif(format =='FLOAT'):
+                self.last_float = self.last_float + self.trend_float
+                values.append((format, self.last_float))
+            else:
+                values.append((format, self.message()))
+        return values
+
+    def message(self) -> str:
+        return f"Calculated following values: INT: {self.last_int} FLOAT: {self.last_float}"
+
+"""Returns the body of a write of a single point of the given publish format"""
+def timeseries_payload(format:str, value, timestamp:datetime) -> dict:
+    return {
+        "datatype": DATATYPES[format],
+        "tsPoints": [
+            {
+            "timestamp": timestamp.isoformat(),
+            "value": value
+            }
+        ]
+    }
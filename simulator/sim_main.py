@@ -1,7 +1,7 @@
-import json, dotenv, requests, os, time, random
-import numpy as np
+import json, dotenv, requests, os, time
 import http.client
 from datetime import datetime
+from signal_generator import SignalGenerator
 #Env var loading
 dotenv.load_dotenv()
 
@@ -150,37 +150,14 @@ def write_value(value_type:str, source_name:str, value, timestamp:datetime, conn
 
 def main():
     upsert_device_info(SOURCE_NAME, publish_formats)
-    generated_int_range = (np.random.randint(-50, 10),np.random.randint(11,100))
-    generated_float_range = (float(np.random.randint(-10,10)),float(np.random.randint(10,40)))
-
-    last_int = np.random.randint(generated_int_range[0], generated_int_range[1]) #will be the latest int value written
-    spread_range_int = abs(generated_int_range[1]-generated_int_range[0])
-    mean_range_int = generated_int_range[0]+(spread_range_int/2)
-
-    last_float = random.uniform(generated_float_range[0], generated_float_range[1]) #will be the latest float value
-    spread_range_float = abs(generated_float_range[1]-generated_float_range[0])
-    mean_range_float = generated_float_range[0]+(spread_range_float/2)
-    
-    trend_int = 0
-    trend_float = 0.0
+    generator = SignalGenerator(publish_formats)
 
     conn = http.client.HTTPSConnection(API_URL, 443)
     while(True):
-        # First set some trend values
-        trend_int = trend_int + ((-random.random()*(float(last_int)-float(mean_range_int))* spread_range_int) / spread_range_int)*0.5
-        trend_float = trend_float + ((-random.random()*(float(last_float)-float(mean_range_float))* spread_range_float) / spread_range_float)*0.5
         # Simulate data
-        for format in publish_formats:
-            if(format == 'INT'):
-                write_value(format, SOURCE_NAME, int(last_int+trend_int), datetime.now(), conn)
-                last_int = int(last_int+trend_int)
-            elif(format =='FLOAT'):
-                write_value(format, SOURCE_NAME, last_float + trend_float, datetime.now(), conn)
-                last_float = last_float + trend_float            
-            else:
-                message = f"Calculated following values: INT: {last_int} FLOAT: {last_float}"
-                write_value(format, SOURCE_NAME, message, datetime.now(), conn)
-        print(f"Calculated following values: INT: {last_int} FLOAT: {last_float}")
+        for format, value in generator.next_values():
+            write_value(format, SOURCE_NAME, value, datetime.now(), conn)
+        print(generator.message())
         print("◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤◢◤")
         time.sleep(delay_sek)
 if(__name__ == '__main__'):